@@ -54,6 +54,128 @@ def populate():
     Populate(db)()
 
 
+@manager.command
+def backfill_ancestor_mpaths():
+    """Fill ancestor_mpaths of every channel and content from its mpath"""
+    from quokka.core.models import Channel, Content, mpath_ancestors
+    for model, include_self in ((Channel, True), (Content, False)):
+        collection = model._get_collection()
+        bulk = collection.initialize_unordered_bulk_op()
+        count = 0
+        for doc in collection.find({'mpath': {'$ne': None}},
+                                   {'mpath': True}):
+            ancestors = mpath_ancestors(doc['mpath'])
+            if not include_self:
+                ancestors.pop()
+            bulk.find({'_id': doc['_id']}).update_one(
+                {'$set': {'ancestor_mpaths': ancestors}})
+            count += 1
+            if count % 1000 == 0:
+                bulk.execute()
+                bulk = collection.initialize_unordered_bulk_op()
+        if count % 1000:
+            bulk.execute()
+        print("{0}: {1} documents updated".format(model.__name__, count))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=1000)
+@manager.option('-r', '--retry', dest='retry', action='store_true',
+                default=False, help="run the failed moves again")
+def run_channel_moves(batch_size=1000, retry=False):
+    """Resume renamed or moved channels whose descendants are not moved"""
+    from quokka.core.models import ChannelMove
+    if retry:
+        ChannelMove.retry_failed()
+    ChannelMove.run_pending(batch_size)
+    for move in ChannelMove.objects(status__ne='done'):
+        print(u"not finished: {0}".format(move))
+
+
+@manager.command
+def backfill_theme_chains():
+    """Fill theme_chain of every channel and content"""
+    from quokka.core.models import Channel
+    from quokka.core.tree import channel_tree
+    channels = channel_tree.get_all()
+    Channel.rebuild_theme_chains(
+        channels, changed=[channel.pk for channel in channels])
+    print("{0} channels and their contents updated".format(len(channels)))
+
+
+@manager.command
+def migrate_comments():
+    """Move comments embedded in contents to the comment collection,
+    an interrupted run can be run again"""
+    from quokka.core.models import Content, Comment
+    contents = Content._get_collection()
+    comments = Comment._get_collection()
+    migrated = 0
+    for doc in contents.find({'comments': {'$exists': True}},
+                             {'comments': True}):
+        embedded = doc.get('comments') or []
+        for comment in embedded:
+            comment.pop('_cls', None)
+            comment['content'] = doc['_id']
+            comment.setdefault('published', True)
+            # upserted, a comment inserted by an interrupted run is kept
+            comments.update({'content': doc['_id'],
+                             'created_at': comment.get('created_at'),
+                             'author': comment.get('author')},
+                            comment, upsert=True)
+        contents.update(
+            {'_id': doc['_id']},
+            {'$unset': {'comments': True},
+             '$set': {'comment_count': comments.find(
+                 {'content': doc['_id'], 'published': True}).count()}}
+        )
+        migrated += len(embedded)
+    Comment.ensure_indexes()
+    print("{0} comments migrated".format(migrated))
+
+
+@manager.option('model', help="document class name, e.g. Post")
+@manager.option('-f', '--format', dest='format', default='ndjson',
+                help="json, ndjson or csv")
+@manager.option('-o', '--output', dest='output', default=None,
+                help="file to write, default stdout")
+@manager.option('-q', '--query', dest='query', default=None,
+                help='raw mongo filter as json, e.g. {"published": true}')
+@manager.option('-z', '--gzip', dest='gzip', action='store_true',
+                default=False)
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=1000)
+def export(model, format, output, query, gzip, batch_size):
+    """Stream the documents of a model as json, ndjson or csv"""
+    import sys
+    from bson import json_util
+    from mongoengine.base import get_document
+    from mongoengine.base.common import _document_registry
+    from quokka.core.exporter import export as export_query
+    try:
+        document = get_document(model)
+    except Exception:
+        matches = [cls for cls in _document_registry.values()
+                   if cls.__name__ == model]
+        if not matches:
+            print("Unknown model {0}".format(model))
+            return
+        document = matches[0]
+
+    queryset = document.objects
+    if query:
+        queryset = queryset(__raw__=json_util.loads(query))
+
+    stream = open(output, 'wb') if output else sys.stdout
+    try:
+        for chunk in export_query(queryset, format, gzip=gzip,
+                                  batch_size=batch_size):
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
+
+
 @manager.command
 def show_config():
     "print all config variables"
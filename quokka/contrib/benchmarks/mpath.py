@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares the channel listing query strategies on a synthetic collection
+
+    python -m quokka.contrib.benchmarks.mpath --host localhost --total 1000000
+
+'regex'      anchored prefix regex on mpath
+'ancestors'  equality match on the multikey ancestor_mpaths
+'unanchored' the former unescaped regex, for reference
+
+prints the time of a page of each strategy and the plan mongodb chose,
+documents and queries carry _cls like Content ones, the listing indexes
+do not start with it
+"""
+
+import re
+import time
+import random
+import argparse
+import datetime
+from pymongo import MongoClient
+
+# Content.objects filters every subclass
+CLASSES = ['Content', 'Content.Post', 'Content.Link']
+
+
+def make_channels(depth, width):
+    channels = [',root,']
+    level = [',root,']
+    for d in range(depth):
+        level = ["{0}c{1}-{2},".format(parent, d, i)
+                 for parent in level for i in range(width)]
+        channels.extend(level)
+    return channels
+
+
+def ancestors(mpath):
+    slugs = mpath.strip(',').split(',')
+    return [",{0},".format(",".join(slugs[:i + 1]))
+            for i in range(len(slugs))]
+
+
+def populate(collection, channels, total, batch=5000):
+    collection.drop()
+    now = datetime.datetime.now()
+    docs = []
+    for i in range(total):
+        channel = random.choice(channels)
+        docs.append({
+            '_cls': random.choice(CLASSES[1:]),
+            'mpath': "{0}doc-{1},".format(channel, i),
+            'ancestor_mpaths': ancestors(channel),
+            'published': i % 10 != 0,
+            'available_at': now - datetime.timedelta(minutes=i),
+            'created_at': now - datetime.timedelta(seconds=i)
+        })
+        if len(docs) == batch:
+            collection.insert(docs)
+            docs = []
+    if docs:
+        collection.insert(docs)
+    collection.create_index([('mpath', 1), ('published', 1),
+                             ('available_at', 1), ('created_at', -1)])
+    collection.create_index([('ancestor_mpaths', 1), ('published', 1),
+                             ('created_at', -1), ('_id', -1)])
+
+
+def queries(mpath):
+    return {
+        'unanchored': {'mpath': {'$regex': mpath}},
+        'regex': {'mpath': {'$regex': '^{0}'.format(re.escape(mpath))}},
+        'ancestors': {'ancestor_mpaths': mpath}
+    }
+
+
+def run(collection, mpath, per_page, repeat):
+    for name, query in sorted(queries(mpath).items()):
+        query = dict(query, published=True, _cls={'$in': CLASSES})
+
+        def cursor():
+            return collection.find(query).sort(
+                [('created_at', -1), ('_id', -1)]).limit(per_page)
+
+        start = time.time()
+        for _ in range(repeat):
+            list(cursor())
+        elapsed = (time.time() - start) / repeat
+        plan = cursor().explain()
+        stats = plan.get('executionStats', plan)
+        print("{0:<12} {1:8.2f}ms examined keys={2} docs={3}".format(
+            name, elapsed * 1000,
+            stats.get('totalKeysExamined', stats.get('nscanned')),
+            stats.get('totalDocsExamined', stats.get('nscannedObjects'))
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=27017)
+    parser.add_argument('--db', default='quokka_benchmark')
+    parser.add_argument('--total', type=int, default=1000000)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--width', type=int, default=8)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--skip-populate', action='store_true')
+    args = parser.parse_args()
+
+    collection = MongoClient(args.host, args.port)[args.db]['content']
+    channels = make_channels(args.depth, args.width)
+    if not args.skip_populate:
+        populate(collection, channels, args.total)
+
+    for mpath in (',root,', channels[1], channels[-1]):
+        print("--- {0}".format(mpath))
+        run(collection, mpath, args.per_page, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
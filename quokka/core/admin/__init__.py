@@ -8,6 +8,7 @@ from flask.ext.admin import Admin
 from flask.ext.admin.babel import gettext, ngettext, lazy_gettext
 
 from .models import ModelAdmin, FileAdmin
+from .indexes import configure_indexes
 from .views import IndexView
 
 logger = logging.getLogger()
@@ -76,6 +77,10 @@ def configure_admin(app, admin):
     if admin.app is None:
         admin.init_app(app)
 
+    configure_indexes(
+        app, [view for view in admin._views if isinstance(view, ModelAdmin)]
+    )
+
     return admin
 
 
@@ -0,0 +1,159 @@
+# coding: utf-8
+
+"""
+Indexes behind the admin list views.
+
+Admin lists filter on column_filters, sort on column_default_sort and
+search on column_searchable_list, without an index each is a scan of the
+whole collection. configure_indexes checks every ModelAdmin at startup:
+
+- a filter column or the default sort without an index gets one when
+  ADMIN_AUTO_INDEXES is set, otherwise a warning names the column.
+  boolean filters and filters on fields with choices are left alone, an
+  index of a few values costs every write and narrows no query
+- with ADMIN_SEARCH_BACKEND = 'text' the searchable columns of all the
+  views of a collection are put in a single text index (MongoDB allows
+  one per collection) and those lists search with $text, when the index
+  can not be used they keep the regex search of Flask-Admin
+"""
+
+import logging
+import pymongo
+from mongoengine import BooleanField
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger()
+
+TEXT_INDEX_NAME = 'admin_search'
+
+
+def column_name(column):
+    """field name of a column_filters or column_searchable_list entry,
+    which can be a name, a field or a filter object"""
+    column = getattr(column, 'column', column)
+    return getattr(column, 'name', column)
+
+
+def db_fields(model, columns, skip_low_cardinality=False):
+    fields = []
+    for column in columns or ():
+        field = model._fields.get(column_name(column))
+        if field is None or field.db_field in fields:
+            continue
+        if skip_low_cardinality and (isinstance(field, BooleanField) or
+                                     field.choices):
+            continue
+        fields.append(field.db_field)
+    return fields
+
+
+def leading_fields(specs):
+    """fields an index can serve, its first key (after _cls)"""
+    fields = set(['_id'])
+    for keys in specs:
+        keys = [key for key, direction in keys]
+        if keys[0] == '_cls' and len(keys) > 1:
+            keys.pop(0)
+        fields.add(keys[0])
+    return fields
+
+
+def indexed_fields(model):
+    specs = [spec['fields'] for spec in model._meta.get('index_specs') or []]
+    specs.extend(index['key'] for index in
+                 model._get_collection().index_information().values())
+    return leading_fields(specs)
+
+
+def sorted_field(view):
+    sort = view.column_default_sort
+    if not sort:
+        return None, False
+    if isinstance(sort, tuple):
+        return sort
+    return sort, False
+
+
+def check_view(view, create=True):
+    """index (or warn about) the filter and default sort columns"""
+    model = view.model
+    indexed = indexed_fields(model)
+    sort, desc = sorted_field(view)
+    wanted = [(field, False) for field in
+              db_fields(model, view.column_filters, True)]
+    if sort in model._fields:
+        wanted.append((model._fields[sort].db_field, desc))
+
+    for field, desc in wanted:
+        if field in indexed:
+            continue
+        if not create:
+            logger.warning(
+                "{0}: no index for {1}, filtering or sorting on it scans "
+                "the {2} collection".format(view.__class__.__name__, field,
+                                            model._get_collection_name()))
+            continue
+        model.ensure_index(("-" if desc else "") + field, background=True)
+        indexed.add(field)
+        logger.info("{0}: index created for {1}".format(
+            view.__class__.__name__, field))
+
+
+def text_index(collection):
+    for name, index in collection.index_information().items():
+        if any(direction == 'text' for key, direction in index['key']):
+            return name, set(index.get('weights', {}))
+    return None, set()
+
+
+def configure_text_search(views, create=True):
+    """one text index per collection for the searchable columns of all
+    its views, text_search is enabled on the views it covers"""
+    collections = {}
+    for view in views:
+        fields = db_fields(view.model, view.column_searchable_list)
+        if fields:
+            entry = collections.setdefault(
+                view.model._get_collection_name(),
+                (view.model._get_collection(), [], set()))
+            entry[1].append(view)
+            entry[2].update(fields)
+
+    for name, (collection, views, fields) in collections.items():
+        try:
+            index_name, covered = text_index(collection)
+            if not fields <= covered and create and \
+                    index_name in (None, TEXT_INDEX_NAME):
+                if index_name:
+                    collection.drop_index(index_name)
+                collection.ensure_index(
+                    [(field, pymongo.TEXT) for field in sorted(fields)],
+                    name=TEXT_INDEX_NAME, background=True)
+                covered = fields
+                logger.info("Text index {0} on {1} for {2}".format(
+                    TEXT_INDEX_NAME, name, sorted(fields)))
+        except PyMongoError as e:
+            logger.warning("Text index on {0} not created: {1}".format(
+                name, e))
+            covered = set()
+
+        for view in views:
+            searched = set(db_fields(view.model,
+                                     view.column_searchable_list))
+            view.text_search = searched <= covered
+            if not view.text_search:
+                logger.warning(
+                    "{0}: no text index for {1}, search scans the {2} "
+                    "collection".format(view.__class__.__name__,
+                                        sorted(searched - covered), name))
+
+
+def configure_indexes(app, views):
+    create = app.config.get('ADMIN_AUTO_INDEXES', True)
+    try:
+        for view in views:
+            check_view(view, create)
+        if app.config.get('ADMIN_SEARCH_BACKEND', 'text') == 'text':
+            configure_text_search(views, create)
+    except PyMongoError as e:
+        logger.warning("Admin indexes not checked: {0}".format(e))
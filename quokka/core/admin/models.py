@@ -1,20 +1,23 @@
 # coding : utf -8
-import json
 import random
 import datetime
 
 from flask.ext.admin.contrib.mongoengine import ModelView
 from flask.ext.admin.contrib.fileadmin import FileAdmin as _FileAdmin
 from flask.ext.admin.babel import gettext, ngettext, lazy_gettext
-from flask.ext.admin import AdminIndexView
+from flask.ext.admin import AdminIndexView, expose
 from flask.ext.admin.actions import action
 from flask.ext.admin import helpers as h
 from flask.ext.security import current_user
 from flask.ext.security.utils import url_for_security
-from flask import redirect, flash, url_for, Response, current_app
+from flask import redirect, flash, url_for, Response, current_app, request
 
-from quokka.modules.accounts.models import User
+from quokka.utils import get_current_user
+from quokka.core.bus import invalidation_bus
+from quokka.core.tree import channel_tree
 from quokka.core.templates import render_template
+from quokka.core.dereference import prefetch
+from quokka.core.exporter import export, MIMETYPES
 
 
 class ThemeMixin(object):
@@ -69,6 +72,44 @@ class ModelAdmin(ThemeMixin, Roled, ModelView):
     formatters = {
         'datetime': format_datetime
     }
+    # reference columns resolved in batch for each list page
+    column_prefetch = ()
+
+    # set by configure_indexes when a text index covers the searchable
+    # columns, search then runs as $text instead of a regex per column
+    text_search = False
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True):
+        if search and self.text_search:
+            count, query = self.get_text_search_list(
+                page, sort_column, sort_desc, search, filters)
+        else:
+            count, query = super(ModelAdmin, self).get_list(
+                page, sort_column, sort_desc, search, filters, execute=False)
+        if execute:
+            query = query.all()
+            if self.column_prefetch:
+                query = prefetch(query, *self.column_prefetch)
+        return count, query
+
+    def get_text_search_list(self, page, sort_column, sort_desc, search,
+                             filters):
+        query = self.get_query()
+        for flt, flt_name, value in filters:
+            f = self._filters[flt]
+            query = f.apply(query, f.clean(value))
+        query = query.filter(__raw__={'$text': {'$search': search}})
+        count = query.count()
+
+        order = (sort_column, sort_desc) if sort_column else \
+            self._get_default_order()
+        if order:
+            query = query.order_by(
+                '{0}{1}'.format('-' if order[1] else '', order[0]))
+        if page is not None:
+            query = query.skip(page * self.page_size)
+        return count, query.limit(self.page_size)
 
     def get_instance(self, i):
         try:
@@ -76,17 +117,94 @@ class ModelAdmin(ThemeMixin, Roled, ModelView):
         except self.model.DoesNotExist:
             flash(gettext("Item not found %(i)s", i=i), "error")
 
+    # Bulk actions run as single updates on the selected ids or, when
+    # posted with all_matching, on everything matching the list filters
+    # and search (the action url carries the list query string).
+    # save and delete signals are not sent, see invalidate_caches
+
+    list_template = 'admin/custom/list.html'
+    bulk_template = 'admin/custom/bulk.html'
+
+    def get_action_query(self, ids):
+        if request.values.get('all_matching'):
+            view_args = self._get_list_extra_args()
+            count, query = self.get_list(0, None, None, view_args.search,
+                                         view_args.filters, execute=False)
+            # same filters, without the page limit
+            return self.get_query().filter(__raw__=query._query)
+        return self.get_query().filter(id__in=ids)
+
+    def invalidate_caches(self):
+        invalidation_bus.invalidate_all()
+
+    def is_action_allowed(self, name):
+        fields = self.model._fields
+        if name in ('publish', 'unpublish', 'toggle_publish'):
+            if 'published' not in fields:
+                return False
+        if name == 'move_channel' and not hasattr(self.model, 'bulk_move'):
+            return False
+        if name == 'retag' and 'tags' not in fields:
+            return False
+        return super(ModelAdmin, self).is_action_allowed(name)
+
+    def bulk_delete(self, query):
+        # delete rules (cascades) still apply
+        query.only('id').delete(_from_doc_delete=True)
+
+    def update_published(self, query, published):
+        update = dict(set__published=published)
+        if 'updated_at' in self.model._fields:
+            update['set__updated_at'] = datetime.datetime.now()
+        if 'last_updated_by' in self.model._fields:
+            user = get_current_user(reference=True)
+            if user:
+                update['set__last_updated_by'] = user
+        return query.update(**update)
+
+    def flash_bulk(self, count):
+        flash(
+            ngettext(
+                'Item successfully updated.',
+                '%(count)s items were successfully updated.',
+                count,
+                count=count
+            )
+        )
+
+    @action(
+        'publish',
+        lazy_gettext('Publish'),
+        lazy_gettext('Publish?')
+    )
+    def action_publish(self, ids):
+        count = self.update_published(self.get_action_query(ids), True)
+        self.invalidate_caches()
+        self.flash_bulk(count)
+
+    @action(
+        'unpublish',
+        lazy_gettext('Unpublish'),
+        lazy_gettext('Unpublish?')
+    )
+    def action_unpublish(self, ids):
+        count = self.update_published(self.get_action_query(ids), False)
+        self.invalidate_caches()
+        self.flash_bulk(count)
+
     @action(
         'toggle_publish',
         lazy_gettext('Publish/Unpublish'),
         lazy_gettext('Publish/Unpublish?')
     )
     def action_toggle_publish(self, ids):
-        for i in ids:
-            instance = self.get_instance(i)
-            instance.published = not instance.published
-            instance.save()
-        count = len(ids)
+        query = self.get_action_query(ids)
+        published = list(query.filter(published=True).scalar('id'))
+        count = self.update_published(query.filter(published__ne=True), True)
+        if published:
+            count += self.update_published(
+                self.get_query().filter(id__in=published), False)
+        self.invalidate_caches()
         flash(
             ngettext(
                 'Item successfully published/Unpublished.',
@@ -96,6 +214,85 @@ class ModelAdmin(ThemeMixin, Roled, ModelView):
             )
         )
 
+    @action(
+        'delete',
+        lazy_gettext('Delete'),
+        lazy_gettext('Are you sure you want to delete selected records?')
+    )
+    def action_delete(self, ids):
+        query = self.get_action_query(ids)
+        count = query.count()
+        self.bulk_delete(query)
+        self.invalidate_caches()
+        flash(
+            ngettext(
+                'Record was successfully deleted.',
+                '%(count)s records were successfully deleted.',
+                count,
+                count=count
+            )
+        )
+
+    @action('move_channel', lazy_gettext('Move to channel'))
+    def action_move_channel(self, ids):
+        return self.redirect_to_bulk_view('move_channel', ids)
+
+    @action('retag', lazy_gettext('Add/Remove tags'))
+    def action_retag(self, ids):
+        return self.redirect_to_bulk_view('retag', ids)
+
+    def redirect_to_bulk_view(self, action_name, ids):
+        args = request.args.to_dict(flat=False)
+        if request.form.get('all_matching'):
+            args['all_matching'] = 1
+        else:
+            args['rowid'] = ids
+        return redirect(url_for('.bulk_view', action_name=action_name, **args))
+
+    @expose('/bulk/<action_name>/', methods=('GET', 'POST'))
+    def bulk_view(self, action_name):
+        """form for the actions which take arguments"""
+        if not self.is_action_allowed(action_name):
+            return redirect(url_for('.index_view'))
+        ids = request.values.getlist('rowid')
+        if request.method == 'POST':
+            query = self.get_action_query(ids)
+            if action_name == 'move_channel':
+                channel = channel_tree.get_by_long_slug(
+                    request.form.get('channel'))
+                if channel is None:
+                    flash(gettext("Channel not found"), 'error')
+                    return redirect(request.url)
+                count, skipped = self.model.bulk_move(query, channel)
+                if skipped:
+                    flash(gettext("%(slugs)s already exist",
+                                  slugs=", ".join(skipped[:20])), 'error')
+            else:
+                count = self.retag(query, request.form.get('add', ''),
+                                   request.form.get('remove', ''))
+            self.invalidate_caches()
+            self.flash_bulk(count)
+            return redirect(url_for('.index_view'))
+
+        query = self.get_action_query(ids)
+        return self.render(self.bulk_template,
+                           action_name=action_name,
+                           ids=ids,
+                           count=query.count(),
+                           all_matching=request.args.get('all_matching'),
+                           channels=sorted(
+                               channel_tree.snapshot.by_long_slug))
+
+    def retag(self, query, add, remove):
+        add = [tag.strip() for tag in add.split(',') if tag.strip()]
+        remove = [tag.strip() for tag in remove.split(',') if tag.strip()]
+        count = 0
+        if add:
+            count = query.update(add_to_set__tags=add)
+        if remove:
+            count = max(count, query.update(pull_all__tags=remove))
+        return count
+
     @action(
         'clone_item',
         lazy_gettext('Create a copy'),
@@ -113,42 +310,40 @@ class ModelAdmin(ThemeMixin, Roled, ModelView):
         new = instance.from_json(instance.to_json())
         new.id = None
         new.published = False
-        new.last_updated_by = User.objects.get(id=current_user.id)
+        new.last_updated_by = get_current_user(reference=True)
         new.updated_at = datetime.datetime.now()
         new.slug = "{0}-{1}".format(new.slug, random.getrandbits(32))
         new.save()
         return redirect(url_for('.edit_view', id=new.id))
 
+    def export_response(self, ids, format):
+        """streamed download of the selected (or all matching) documents,
+        gzipped on the fly when the client accepts it"""
+        query = self.get_action_query(ids)
+        headers = {
+            "Content-Disposition": "attachment;filename={0}.{1}".format(
+                self.model.__name__.lower(), format)
+        }
+        gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+        if gzip:
+            headers['Content-Encoding'] = 'gzip'
+        return Response(
+            export(query, format, gzip=gzip),
+            mimetype=MIMETYPES[format],
+            headers=headers
+        )
+
     @action('export_to_json', lazy_gettext('Export as json'))
     def export_to_json(self, ids):
-        qs = self.model.objects(id__in=ids)
+        return self.export_response(ids, 'json')
 
-        return Response(
-            qs.to_json(),
-            mimetype="text/json",
-            headers={
-                "Content-Disposition":
-                "attachment;filename=%s.json" % self.model.__name__.lower()
-            }
-        )
+    @action('export_to_ndjson', lazy_gettext('Export as json lines'))
+    def export_to_ndjson(self, ids):
+        return self.export_response(ids, 'ndjson')
 
     @action('export_to_csv', lazy_gettext('Export as csv'))
     def export_to_csv(self, ids):
-        qs = json.loads(self.model.objects(id__in=ids).to_json())
-
-        def generate():
-            yield ','.join(list(qs[0].keys())) + '\n'
-            for item in qs:
-                yield ','.join([str(i) for i in list(item.values())]) + '\n'
-
-        return Response(
-            generate(),
-            mimetype="text/csv",
-            headers={
-                "Content-Disposition":
-                "attachment;filename=%s.csv" % self.model.__name__.lower()
-            }
-        )
+        return self.export_response(ids, 'csv')
 
 
 class BaseIndexView(Roled, ThemeMixin, AdminIndexView):
@@ -0,0 +1,421 @@
+# coding: utf-8
+
+"""
+Invalidation bus shared by the workers of a site.
+
+The channel tree, the config registry, the template resolver and the
+'simple' response cache live in the memory of each worker, invalidating
+them in the worker which saved a document leaves the other workers stale.
+Invalidations are published on the bus instead, they run at once in the
+publishing worker and are broadcast to every other worker::
+
+    invalidation_bus.publish('purge', tags=[content_tag(content.id)])
+
+Events are 'config', 'channels', 'templates', 'purge' and 'all'. The
+transport is chosen by INVALIDATION_BUS:
+
+- None, invalidations stay in the worker (a single process)
+- 'mongodb', messages go to a capped collection tailed by every worker
+- 'file', messages are appended to a file and polled, for the workers of
+  a single host
+
+INVALIDATION_BUS_OPTIONS are passed to the transport (the collection or
+the path, sizes and poll intervals).
+
+Every message carries a sequence number. A worker receiving a number
+further than the next one it expects holds it back, a sender of the
+mongodb transport reserves its number before inserting the message and
+concurrent senders can insert out of order. When the missing message does
+not arrive within INVALIDATION_BUS_GRACE seconds it was lost (the capped
+collection or the file were rotated faster than the worker read them) and
+the worker invalidates everything. A number lower than the last one run
+means the counter was reset (its file or collection was removed), the
+worker starts over from it and invalidates everything as well.
+"""
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import logging
+import threading
+from flask import current_app, has_app_context
+from pymongo.errors import PyMongoError, CollectionInvalid
+from quokka.core.cache import response_cache, ALL
+from quokka.core.config import config_registry
+from quokka.core.templates import template_resolver
+from quokka.core.tree import channel_tree
+
+logger = logging.getLogger()
+
+
+class MongoTransport(object):
+    """capped collection tailed with an awaiting cursor"""
+
+    def __init__(self, collection='invalidation_bus', size=1024 * 1024,
+                 poll_interval=0.5):
+        self.name = collection
+        self.size = size
+        self.poll_interval = poll_interval
+
+    @property
+    def db(self):
+        from mongoengine.connection import get_db
+        return get_db()
+
+    @property
+    def collection(self):
+        db = self.db
+        if self.name not in db.collection_names():
+            try:
+                db.create_collection(self.name, capped=True, size=self.size)
+            except CollectionInvalid:
+                pass  # created by another worker
+        return db[self.name]
+
+    @property
+    def counters(self):
+        return self.db['{0}_counters'.format(self.name)]
+
+    def send(self, message):
+        counter = self.counters.find_and_modify(
+            {'_id': self.name}, {'$inc': {'seq': 1}}, upsert=True, new=True)
+        message['seq'] = counter['seq']
+        self.collection.insert(message)
+        return message['seq']
+
+    def last_seq(self):
+        counter = self.counters.find_one({'_id': self.name})
+        return counter['seq'] if counter else 0
+
+    def listen(self, after, callback, stopped):
+        collection = self.collection
+        while not stopped.is_set():
+            # natural order, the order messages were inserted in
+            cursor = collection.find({'seq': {'$gt': after}},
+                                     tailable=True, await_data=True)
+            while cursor.alive and not stopped.is_set():
+                for message in cursor:
+                    # the last seq received without gaps, messages
+                    # inserted late are found again by the next cursor
+                    after = callback(message)
+                # an empty capped collection returns a dead cursor at once
+                time.sleep(self.poll_interval if not cursor.alive else 0)
+
+
+class FileTransport(object):
+    """json lines appended to a file and polled, the sequence number is
+    kept in a counter file next to it, locked while a message is sent"""
+
+    def __init__(self, path='/tmp/quokka_invalidation_bus',
+                 max_bytes=1024 * 1024, poll_interval=0.2):
+        self.path = path
+        self.counter_path = '{0}.seq'.format(path)
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+
+    def _read_seq(self, counter):
+        counter.seek(0)
+        try:
+            return int(counter.read().strip() or 0)
+        except ValueError:
+            return 0  # a write was interrupted, listeners resync
+
+    def send(self, message):
+        with open(self.counter_path, 'a+') as counter:
+            fcntl.flock(counter, fcntl.LOCK_EX)
+            try:
+                message['seq'] = self._read_seq(counter) + 1
+                counter.seek(0)
+                counter.truncate()
+                counter.write(str(message['seq']))
+                counter.flush()
+                with open(self.path, 'a') as stream:
+                    if os.path.getsize(self.path) > self.max_bytes:
+                        stream.truncate(0)
+                    stream.write(json.dumps(message) + "\n")
+            finally:
+                fcntl.flock(counter, fcntl.LOCK_UN)
+        return message['seq']
+
+    def last_seq(self):
+        if not os.path.exists(self.counter_path):
+            return 0
+        with open(self.counter_path) as counter:
+            fcntl.flock(counter, fcntl.LOCK_SH)
+            try:
+                return self._read_seq(counter)
+            finally:
+                fcntl.flock(counter, fcntl.LOCK_UN)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def listen(self, after, callback, stopped):
+        inode, offset = self._stat()
+        pending = ''
+        while not stopped.wait(self.poll_interval):
+            current, size = self._stat()
+            if current is None:
+                continue
+            if current != inode or size < offset:
+                # rotated or recreated
+                inode, offset, pending = current, 0, ''
+            if size == offset:
+                continue
+            with open(self.path) as stream:
+                stream.seek(offset)
+                data = pending + stream.read(size - offset)
+            offset = size
+            lines = data.split("\n")
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    callback(json.loads(line))
+
+
+TRANSPORTS = {
+    'mongodb': MongoTransport,
+    'file': FileTransport
+}
+
+
+class InvalidationBus(object):
+
+    def __init__(self, app=None):
+        self.app = None
+        self.transport = None
+        self._token = uuid.uuid4().hex
+        self.version = 0
+        self.received = 0
+        self.missed = 0
+        self.grace = 2
+        self._pending = {}
+        self._gap_since = None
+        self._skipped = (0, 0)
+        self._pid = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._receiving = threading.RLock()
+        self.handlers = {
+            'config': self.on_config,
+            'channels': self.on_channels,
+            'templates': self.on_templates,
+            'purge': self.on_purge,
+            'all': self.on_all
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.grace = config.get('INVALIDATION_BUS_GRACE', self.grace)
+        name = config.get('INVALIDATION_BUS')
+        if name:
+            if name not in TRANSPORTS:
+                raise ValueError(
+                    "Unknown INVALIDATION_BUS {0}".format(name))
+            self.transport = TRANSPORTS[name](
+                **config.get('INVALIDATION_BUS_OPTIONS', {}))
+            app.before_request(self.ensure_listening)
+        app.extensions['invalidation_bus'] = self
+
+    @property
+    def origin(self):
+        """id of this worker, the token alone is shared by forked workers"""
+        return '{0}:{1}'.format(os.getpid(), self._token)
+
+    # handlers, run in the publishing worker and in the listeners
+
+    def get_app(self):
+        if has_app_context():
+            return current_app._get_current_object()
+        return self.app
+
+    def on_config(self, payload, remote=False):
+        config_registry.invalidate()
+        app = self.get_app()
+        if app is not None and payload.get('group') in ('settings', None):
+            config_registry.sync_settings(app)
+
+    def on_channels(self, payload, remote=False):
+        channel_tree.invalidate()
+
+    def on_templates(self, payload, remote=False):
+        template_resolver.clear()
+
+    def on_purge(self, payload, remote=False):
+        # a filesystem cache is shared, purged by the publisher already
+        if not remote or not response_cache.shared:
+            response_cache.purge(*payload.get('tags', [ALL]))
+
+    def on_all(self, payload, remote=False):
+        self.on_config({}, remote)
+        self.on_channels({}, remote)
+        self.on_templates({}, remote)
+        self.on_purge({'tags': [ALL]}, remote)
+
+    def dispatch(self, event, payload, remote=False):
+        self.handlers[event](payload, remote)
+
+    # publishing
+
+    def publish(self, event, **payload):
+        """run event here and broadcast it to the other workers"""
+        self.dispatch(event, payload)
+        if self.transport is None:
+            return
+        message = {'origin': self.origin, 'event': event, 'payload': payload}
+        try:
+            self.transport.send(message)
+        except (PyMongoError, IOError, ValueError) as e:
+            logger.warning("Invalidation {0} not broadcast: {1}".format(
+                event, e))
+
+    def channels_changed(self, *args, **kwargs):
+        """signal receiver"""
+        self.publish('channels')
+
+    def templates_changed(self, *args, **kwargs):
+        """signal receiver"""
+        self.publish('templates')
+
+    def config_changed(self, sender, document, **kwargs):
+        """signal receiver"""
+        self.publish('config', group=document.group)
+
+    def purge_all(self, *args, **kwargs):
+        """signal receiver, purges the whole response cache"""
+        self.publish('purge', tags=[ALL])
+
+    def purge(self, *tags):
+        self.publish('purge', tags=list(tags))
+
+    def invalidate_all(self):
+        self.publish('all')
+
+    # listening
+
+    def receive(self, message):
+        """run message in sequence order, returns the last seq run"""
+        with self._receiving:
+            seq = message['seq']
+            low, high = self._skipped
+            if seq == self.version or seq in self._pending or \
+                    low < seq <= high:
+                return self.version  # covered by a resync or a duplicate
+            if seq < self.version:
+                # the counter was reset, its file or collection was removed
+                logger.warning("Invalidation bus restarted at {0} after {1}, "
+                               "invalidating everything".format(
+                                   seq, self.version))
+                self.version = seq
+                self._pending.clear()
+                self._gap_since = None
+                self._skipped = (0, 0)
+                self.resync()
+                return self.version
+            if self.version and seq > self.version + 1:
+                # wait for the messages before it
+                self._pending[seq] = message
+                if self._gap_since is None:
+                    self._gap_since = time.time()
+                self.check_gap()
+                return self.version
+            self.run(message)
+            while self.version + 1 in self._pending:
+                self.run(self._pending.pop(self.version + 1))
+            self._gap_since = time.time() if self._pending else None
+            return self.version
+
+    def check_gap(self):
+        """invalidate everything when a missing message did not arrive
+        within the grace period"""
+        if self._gap_since is None:
+            return
+        with self._receiving:
+            if self._gap_since is None or \
+                    time.time() - self._gap_since < self.grace:
+                return
+            self.missed += 1
+            logger.warning("Invalidation bus missed messages after {0}, "
+                           "invalidating everything".format(self.version))
+            self._skipped = (self.version, max(self._pending))
+            self.version = max(self._pending)
+            self._pending.clear()
+            self._gap_since = None
+            self.resync()
+
+    def resync(self):
+        """invalidate everything, messages may have been lost"""
+        try:
+            self.on_all({}, remote=True)
+        except Exception as e:
+            # mongodb is unreachable too, the next resync retries
+            logger.warning("Invalidation bus resync failed: {0}".format(e))
+
+    def run(self, message):
+        self.version = message['seq']
+        if message['origin'] == self.origin:
+            return
+        self.received += 1
+        try:
+            self.dispatch(message['event'], message['payload'], remote=True)
+        except Exception as e:
+            logger.warning("Invalidation {0} failed: {1}".format(
+                message['event'], e))
+
+    def listen(self):
+        try:
+            while not self._stopped.is_set():
+                try:
+                    with self._receiving:
+                        self.version = self.transport.last_seq()
+                        self._pending.clear()
+                        self._gap_since = None
+                    self.transport.listen(self.version, self.receive,
+                                          self._stopped)
+                except Exception as e:
+                    logger.warning("Invalidation bus listener: {0}".format(e))
+                    # messages may be lost until it reconnects
+                    self.resync()
+                    self._stopped.wait(1)
+        finally:
+            # restarted by the next request
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._pid = None
+
+    def ensure_listening(self):
+        """start the listener thread once in each (forked) worker"""
+        if self._pid == os.getpid():
+            self.check_gap()
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self.listen,
+                                            name='invalidation-bus')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._pid = None
+
+    @property
+    def stats(self):
+        return {'version': self.version, 'received': self.received,
+                'missed': self.missed, 'pending': len(self._pending)}
+
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,229 @@
+# coding: utf-8
+
+"""
+Full page response cache for anonymous visitors.
+
+Responses are keyed on path + query string, theme and locale and stored in
+a werkzeug cache backend ('simple' for local memory or 'filesystem' to
+share the cache between workers on the same host).
+
+Views label what they render with tags, invalidating a tag purges every
+page labeled with it::
+
+    response_cache.tag('content:%s' % content.id)
+    ...
+    response_cache.purge('content:%s' % content.id)
+
+Invalidation does not scan the backend, each tag holds a version token
+and a cached page is only served while all of its tag versions match.
+
+CSRF tokens rendered in cached forms are replaced by a fresh token of the
+current visitor when the page is served from the cache.
+"""
+
+import re
+import uuid
+import logging
+import threading
+from functools import wraps
+from flask import request, session, current_app, g, make_response
+from werkzeug.contrib.cache import SimpleCache, FileSystemCache, NullCache
+from quokka.core.conditional import get_request_variant
+
+logger = logging.getLogger()
+
+# every cached page carries this tag, purging it clears the whole cache
+ALL = 'all'
+
+CSRF_PLACEHOLDER = '__response_cache_csrf_token__'
+CSRF_INPUT = re.compile(r'(name="csrf_token" type="hidden" value=")[^"]*(")')
+
+
+def channel_tag(long_slug):
+    return u'channel:{0}'.format(long_slug)
+
+
+def content_tag(content_id):
+    return u'content:{0}'.format(content_id)
+
+
+class ResponseCache(object):
+
+    def __init__(self, app=None):
+        self.backend = NullCache()
+        self.enabled = False
+        # shared by the workers of the host (see quokka.core.bus)
+        self.shared = False
+        self.timeout = 300
+        self.tag_timeout = 60 * 60 * 24 * 30
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('RESPONSE_CACHE_ENABLED', False)
+        self.timeout = config.get('RESPONSE_CACHE_TIMEOUT', self.timeout)
+        cache_type = config.get('RESPONSE_CACHE_TYPE', 'simple')
+
+        if cache_type == 'simple':
+            self.backend = SimpleCache(
+                threshold=config.get('RESPONSE_CACHE_THRESHOLD', 500),
+                default_timeout=self.timeout
+            )
+        elif cache_type == 'filesystem':
+            self.shared = True
+            self.backend = FileSystemCache(
+                config.get('RESPONSE_CACHE_DIR'),
+                threshold=config.get('RESPONSE_CACHE_THRESHOLD', 500),
+                default_timeout=self.timeout
+            )
+        else:
+            raise ValueError(
+                "Unknown RESPONSE_CACHE_TYPE {0}".format(cache_type))
+
+        app.extensions['response_cache'] = self
+
+    # stats
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hit_ratio}
+
+    def __repr__(self):
+        return "<ResponseCache {0} hits={1} misses={2} ratio={3:.2f}>".format(
+            self.backend.__class__.__name__,
+            self.hits, self.misses, self.hit_ratio
+        )
+
+    # tags
+
+    def tag(self, *tags):
+        """label the response being rendered with tags"""
+        if not hasattr(g, 'response_cache_tags'):
+            g.response_cache_tags = set()
+        g.response_cache_tags.update(tags)
+
+    def _tag_key(self, tag):
+        return u'tag:{0}'.format(tag)
+
+    def _tag_versions(self, tags, create=False):
+        tags = list(tags)
+        versions = self.backend.get_many(*map(self._tag_key, tags))
+        result = {}
+        for tag, version in zip(tags, versions):
+            if version is None and create:
+                version = self._new_version(tag)
+            result[tag] = version
+        return result
+
+    def _new_version(self, tag):
+        version = uuid.uuid4().hex
+        self.backend.set(self._tag_key(tag), version, self.tag_timeout)
+        return version
+
+    def purge(self, *tags):
+        """invalidate every cached page labeled with any of tags"""
+        for tag in tags:
+            self._new_version(tag)
+        logger.debug("Response cache purged tags: {0}".format(tags))
+
+    def purge_all(self, *args, **kwargs):
+        """signal receiver, invalidates the whole cache"""
+        self.purge(ALL)
+
+    # responses
+
+    def is_cacheable(self):
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return False
+
+        from flask.ext.security import current_user
+        if current_user.is_authenticated() or '_flashes' in session:
+            return False
+
+        admin_url = current_app.config.get('ADMIN', {}).get('url', '/admin')
+        return not request.path.startswith(admin_url)
+
+    def make_key(self):
+        theme, locale, user_id = get_request_variant()
+        return u'response:{0}:{1}:{2}?{3}'.format(
+            theme, locale, request.path,
+            request.query_string.decode('utf-8', 'replace')
+        )
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is not None:
+            current = self._tag_versions(entry['tags'])
+            if current != entry['tags']:
+                entry = None
+        self._count(entry is not None)
+        return entry
+
+    def set(self, key, response, tags):
+        tags = set(tags)
+        tags.add(ALL)
+        headers = [(k, v) for k, v in response.headers
+                   if k.lower() not in ('set-cookie', 'content-length')]
+        body = CSRF_INPUT.sub(r'\g<1>{0}\g<2>'.format(CSRF_PLACEHOLDER),
+                              response.get_data())
+        entry = {
+            'status': response.status_code,
+            'headers': headers,
+            'body': body,
+            'tags': self._tag_versions(tags, create=True)
+        }
+        self.backend.set(key, entry, self.timeout)
+
+    def cached(self, view):
+        """decorator for views whose output only depends on the url,
+        theme and locale. use it in MethodView.decorators"""
+
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if not self.is_cacheable():
+                return view(*args, **kwargs)
+
+            key = self.make_key()
+            entry = self.get(key)
+            if entry is not None:
+                body = entry['body']
+                if CSRF_PLACEHOLDER in body:
+                    from flask.ext.wtf.csrf import generate_csrf
+                    body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+                response = current_app.response_class(
+                    body,
+                    status=entry['status'],
+                    headers=entry['headers']
+                )
+                response.headers['X-Cache'] = 'HIT'
+                return response.make_conditional(request)
+
+            g.response_cache_tags = set()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and \
+                    not response.direct_passthrough:
+                self.set(key, response, g.response_cache_tags)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return decorated
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,67 @@
+# coding: utf-8
+
+"""
+Conditional GET (ETag / Last-Modified / 304) helpers.
+
+Validators are computed from the documents a page shows, before rendering,
+so revalidation requests are answered without touching the templates::
+
+    return conditional(
+        make_etag('content', content.id, content.updated_at),
+        content.updated_at,
+        lambda: render_template('content/detail.html', content=content)
+    )
+"""
+
+import hashlib
+from flask import request, session, current_app, make_response
+from werkzeug.http import is_resource_modified
+
+
+def get_request_variant():
+    """theme, locale and user a page is rendered for"""
+    from flask.ext.security import current_user
+    theme = session.get('theme', current_app.config.get('DEFAULT_THEME'))
+    locale = session.get('lang',
+                         current_app.config.get('BABEL_DEFAULT_LOCALE'))
+    return theme, locale, current_user.get_id()
+
+
+def make_etag(*parts):
+    """strong etag for the given parts and the current request variant"""
+    parts = parts + get_request_variant()
+    raw = u"|".join(u"{0}".format(part) for part in parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def latest(*dates):
+    dates = [date for date in dates if date]
+    return max(dates) if dates else None
+
+
+def not_modified(etag, last_modified=None):
+    """returns a 304 response when the client copy is still fresh"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if is_resource_modified(request.environ, etag,
+                            last_modified=last_modified):
+        return None
+    response = current_app.response_class(status=304)
+    return set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def conditional(etag, last_modified, render):
+    """answers 304 or calls render() and adds the validators to its
+    response"""
+    response = not_modified(etag, last_modified)
+    if response is None:
+        response = set_validators(make_response(render()),
+                                  etag, last_modified)
+    return response
@@ -0,0 +1,141 @@
+# coding: utf-8
+
+"""
+In-process registry of the Config groups.
+
+Every Config is loaded in a single query into a snapshot holding the
+values already parsed by their formatter in a dict keyed by (group, name),
+so Config.get and the templates calling it in loops do not hit MongoDB nor
+json.loads the same value again.
+
+Like the channel tree the registry is versioned, saving or deleting a
+Config bumps the version (see the signals connected in quokka.core.models)
+and the next access reloads the snapshot.
+
+    from quokka.core.config import config_registry
+    config_registry.get('settings', 'SITE_NAME', 'Quokka')
+
+Pages depending on the configs use the etag of the snapshot, a digest of
+the values which is the same in every worker, the version is local.
+
+Parsed json values are shared by every request, do not change them.
+"""
+
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger()
+
+
+class ConfigSnapshot(object):
+
+    def __init__(self, configs, version):
+        self.version = version
+        self._etag = None
+        self.configs = {}
+        self.values = {}
+        duplicated = set()
+
+        for config in configs:
+            self.configs[config.group] = config
+            for custom_value in config.values:
+                key = (config.group, custom_value.name)
+                try:
+                    value = custom_value.value
+                except Exception as e:
+                    logger.warning("Config {0} {1} not loaded: {2}".format(
+                        config.group, custom_value.name, e))
+                    continue
+                if key in self.values:
+                    duplicated.add(key)
+                self.values[key] = value
+
+        # Config.get returns None for names defined more than once
+        for key in duplicated:
+            self.values[key] = None
+
+    @property
+    def etag(self):
+        """digest of the parsed values"""
+        if self._etag is None:
+            raw = json.dumps(sorted(self.values.items()), default=repr)
+            self._etag = hashlib.sha1(raw).hexdigest()
+        return self._etag
+
+    def group(self, group):
+        """dict of the parsed values of group"""
+        return dict((name, value) for (key, name), value in
+                    self.values.items() if key == group)
+
+
+class ConfigRegistry(object):
+
+    def __init__(self):
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def invalidate(self, *args, **kwargs):
+        """signal receiver, mark the current snapshot as stale"""
+        with self._lock:
+            self.version += 1
+
+    def build(self):
+        from quokka.core.models import Config
+        version = self.version
+        snapshot = ConfigSnapshot(Config.objects, version)
+        self.loads += 1
+        logger.debug("Config version {0} loaded with {1} groups".format(
+            version, len(snapshot.configs)))
+        return snapshot
+
+    @property
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != self.version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != self.version:
+                    snapshot = self._snapshot = self.build()
+        return snapshot
+
+    def get(self, group, name=None, default=None):
+        """parsed value of name in group, the values of group when no
+        name is given, default when missing or empty"""
+        snapshot = self.snapshot
+        if name:
+            value = snapshot.values.get((group, name))
+        else:
+            config = snapshot.configs.get(group)
+            value = config and config.values
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value or default
+
+    def get_group(self, group):
+        return self.snapshot.group(group)
+
+    @property
+    def etag(self):
+        return self.snapshot.etag
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'loads': self.loads, 'version': self.version}
+
+    def sync_settings(self, app):
+        """copy the values of the `settings` group to app.config"""
+        settings = self.get_group('settings')
+        app.config.update(settings)
+        return settings
+
+
+config_registry = ConfigRegistry()
@@ -0,0 +1,67 @@
+# coding: utf-8
+
+"""
+Batched dereferencing of ReferenceFields for a page of documents.
+
+Each ReferenceField of a document loaded from MongoDB is fetched with its
+own query the first time it is read, a listing reading content.channel and
+content.created_by costs 2 queries per row. prefetch resolves them all
+before rendering, with one $in query per referenced collection::
+
+    contents = paginate(Content.objects(...))
+    prefetch(contents, 'channel', 'created_by', 'template_type')
+
+Channels are taken from the channel tree and do not hit the database.
+"""
+
+import logging
+from mongoengine import ReferenceField
+from quokka.core.tree import channel_tree, ref_id
+
+logger = logging.getLogger()
+
+
+def _unresolved(document, name):
+    """id of a not yet dereferenced reference field or None"""
+    field = document._fields.get(name)
+    if not isinstance(field, ReferenceField):
+        return None, None
+    value = document._data.get(name)
+    if value is None or hasattr(value, '_data'):
+        return None, None
+    return field.document_type, ref_id(value)
+
+
+def _fetch(document_type, ids):
+    from quokka.core.models import Channel
+    if issubclass(document_type, Channel):
+        return dict((pk, channel_tree.get(pk)) for pk in ids)
+    return dict((doc.pk, doc) for doc in document_type.objects(pk__in=ids))
+
+
+def prefetch(documents, *fields):
+    """dereference fields of every document in documents, in place.
+    references to missing documents are left as they are"""
+    documents = list(documents)
+    wanted = {}
+    for document in documents:
+        for name in fields:
+            document_type, pk = _unresolved(document, name)
+            if pk is not None:
+                wanted.setdefault(document_type, set()).add(pk)
+
+    resolved = {}
+    for document_type, ids in wanted.items():
+        resolved[document_type] = _fetch(document_type, list(ids))
+
+    for document in documents:
+        for name in fields:
+            document_type, pk = _unresolved(document, name)
+            target = resolved.get(document_type, {}).get(pk)
+            if target is not None:
+                # bypass the field setter, the document is not changed
+                document._data[name] = target
+
+    logger.debug("prefetched {0} of {1} documents from {2} collections"
+                 .format(fields, len(documents), len(wanted)))
+    return documents
@@ -0,0 +1,135 @@
+# coding: utf-8
+
+"""
+Streaming export of a queryset as json, ndjson or csv.
+
+Documents are read as raw dicts from a non caching cursor and written
+batch by batch, memory does not grow with the number of documents::
+
+    for chunk in export(Post.objects(published=True), 'csv', gzip=True):
+        stream.write(chunk)
+
+csv columns are the fields of the model and of all its subclasses, the
+undeclared fields of dynamic documents go as json to an `_extra` column,
+so every row of an export has the same columns.
+"""
+
+import csv
+import zlib
+import logging
+import datetime
+from cStringIO import StringIO
+from bson import json_util, DBRef
+from mongoengine.base import get_document
+from quokka.utils import batches
+
+logger = logging.getLogger()
+
+MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+def documents(query, batch_size=1000):
+    """lists of up to batch_size raw documents of query"""
+    queryset = query.as_pymongo().no_cache()
+    queryset._cursor.batch_size(batch_size)
+    return batches(queryset, batch_size)
+
+
+def dumps(document):
+    return json_util.dumps(document)
+
+
+def json_lines(chunks):
+    for batch in chunks:
+        yield "".join(dumps(document) + "\n" for document in batch)
+
+
+def json_array(chunks):
+    yield "["
+    separator = "\n"
+    for batch in chunks:
+        yield separator + ",\n".join(dumps(document) for document in batch)
+        separator = ",\n"
+    yield "\n]\n"
+
+
+def csv_columns(model):
+    """db field names of model and its subclasses, _id first"""
+    classes = [model] + [get_document(name)
+                         for name in model._subclasses[1:]]
+    columns = ['_id']
+    if model._meta.get('allow_inheritance'):
+        columns.append('_cls')
+    for klass in classes:
+        for name in klass._fields_ordered:
+            db_field = klass._fields[name].db_field
+            if db_field not in columns:
+                columns.append(db_field)
+    if any(klass._dynamic for klass in classes):
+        columns.append('_extra')
+    return columns
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, DBRef):
+        return str(value.id)
+    if isinstance(value, (list, dict)):
+        return dumps(value)
+    return str(value)
+
+
+def csv_rows(chunks, columns):
+    declared = [column for column in columns if column != '_extra']
+    extra = '_extra' in columns
+    known = set(declared)
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in chunks:
+        for document in batch:
+            row = [csv_value(document.get(column)) for column in declared]
+            if extra:
+                extras = dict((key, value) for key, value in document.items()
+                              if key not in known)
+                row.append(dumps(extras) if extras else '')
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzipped(chunks, level=6):
+    """gzip stream of chunks, compressed as they come"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(query, format='json', gzip=False, batch_size=1000):
+    """chunks of the export of query, format is json, ndjson or csv"""
+    if format not in MIMETYPES:
+        raise ValueError("Unknown export format {0}".format(format))
+    chunks = documents(query, batch_size)
+    if format == 'csv':
+        output = csv_rows(chunks, csv_columns(query._document))
+    elif format == 'ndjson':
+        output = json_lines(chunks)
+    else:
+        output = json_array(chunks)
+    if gzip:
+        output = gzipped(output)
+    return output
@@ -1,7 +1,33 @@
 # coding: utf-8
 
-from mongoengine import fields
+"""
+ListField whose values are FilteredLists, lists of embedded documents
+queried like a queryset::
+
+    content.values.get(name='color')
+    content.values.filter(formatter='json').count()
+    content.values.update({'rawvalue': 'red'}, name='color')
+    content.values.delete(name='color')
+    content.values.create(name='size', rawvalue='10', formatter='int')
+
+Equality lookups are answered from hash indexes built on first use for
+each set of fields and dropped when the list or one of its items changes.
+Items have to be IndexedItems to tell their lists they were changed in
+place (item.name = 'x'), lists of other items are scanned on each lookup.
+Reference fields are compared by id, items are not dereferenced.
+
+create, update and delete write a single $push, positional $set or $pull
+to the parent document instead of saving and reloading it, a parent which
+was never saved is saved as before. The write also sets updated_at and
+post_save is sent for the parent, its caches are invalidated as if it
+was saved.
+"""
+
+import weakref
+import datetime
+from mongoengine import fields, signals
 from mongoengine.base.datastructures import BaseList
+from quokka.core.tree import ref_id
 
 
 class MultipleObjectsReturned(Exception):
@@ -12,114 +38,217 @@ def match_all(i, kwargs):
     return all([getattr(i, k) == v for k, v in kwargs.items()])
 
 
-def getinstance(_instance):
-    return _instance.__class__.objects.get(pk=_instance.pk)
+class IndexState(object):
+    """shared by a FilteredList and the items of its indexes"""
 
+    def __init__(self):
+        self.stale = False
 
-def only_matches(obj, kwargs, silent=True):
-    if not kwargs and silent:
-        return obj
-    return filter(lambda i: match_all(i, kwargs), obj)
 
+class IndexedItem(object):
+    """mixin of embedded documents, an item changed in place marks the
+    indexes of the FilteredLists holding it as stale"""
 
-def _exclude(self):
-    def inner(*args, **kwargs):
-        _values = only_matches(self, kwargs, silent=False)
-        values = [item for item in self if item not in _values]
-        return FilteredList(values, getinstance(self._instance), self._name)
-    return inner
+    def _watch(self, state):
+        states = self.__dict__.get('_index_states')
+        if states is None:
+            states = self.__dict__['_index_states'] = weakref.WeakSet()
+        states.add(state)
 
+    def _mark_as_changed(self, key):
+        for state in self.__dict__.get('_index_states', ()):
+            state.stale = True
+        return super(IndexedItem, self)._mark_as_changed(key)
 
-def _filter(self):
-    def inner(*args, **kwargs):
-        values = only_matches(self, kwargs)
-        return FilteredList(values, getinstance(self._instance), self._name)
-    return inner
 
+class FilteredList(BaseList):
 
-def _get(self):
-    def inner(*args, **kwargs):
-        values = only_matches(self, kwargs)
+    def __init__(self, *args, **kwargs):
+        super(FilteredList, self).__init__(*args, **kwargs)
+        self._indexes = {}
+        self._state = IndexState()
+
+    def _mark_as_changed(self, *args, **kwargs):
+        self._indexes = {}
+        return super(FilteredList, self)._mark_as_changed(*args, **kwargs)
+
+    def reset_indexes(self):
+        self._indexes = {}
+        self._state.stale = False
+
+    # lookups
+
+    def _key(self, item, name):
+        """value of name in item, the id of references"""
+        field = getattr(item, '_fields', {}).get(name)
+        if isinstance(field, (fields.ReferenceField,
+                              fields.GenericReferenceField)):
+            return ref_id(item._data.get(name))
+        return getattr(item, name)
+
+    def _index(self, names):
+        """index of the items by the values of names, None when the items
+        can not tell they were changed"""
+        if self._state.stale:
+            self.reset_indexes()
+        index = self._indexes.get(names)
+        if index is None:
+            index = {}
+            for item in self:
+                if not isinstance(item, IndexedItem):
+                    return None
+                item._watch(self._state)
+                key = tuple(self._key(item, name) for name in names)
+                index.setdefault(key, []).append(item)
+            self._indexes[names] = index
+        return index
+
+    def _matches(self, kwargs):
+        if not kwargs:
+            return list(self)
+        names = tuple(sorted(kwargs))
+        key = tuple(ref_id(kwargs[name]) if hasattr(kwargs[name], '_data')
+                    else kwargs[name] for name in names)
+        try:
+            index = self._index(names)
+            if index is not None:
+                return list(index.get(key, []))
+        except TypeError:  # unhashable values
+            pass
+        return [item for item in self if match_all(item, kwargs)]
+
+    def _clone(self, values):
+        clone = FilteredList(values, None, self._name)
+        clone._instance = self._instance  # already a weak proxy
+        return clone
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self._matches(kwargs))
+
+    def exclude(self, *args, **kwargs):
+        excluded = set(id(item) for item in self._matches(kwargs))
+        return self._clone([item for item in self
+                            if id(item) not in excluded])
+
+    def get(self, *args, **kwargs):
+        values = self._matches(kwargs)
         if len(values) > 1:
             raise MultipleObjectsReturned("More than one object returned")
         return values and values[0]
-    return inner
 
+    def count(self, *args, **kwargs):
+        return len(self)
 
-def _delete(self):
-    def inner(*args, **kwargs):
-        values = only_matches(self, kwargs)
-        for item in values:
-            self.remove(item)
-        self._instance.save()
-        self._instance.reload()
+    # writes
+
+    def _result(self, values):
         if len(values) > 1:
-            return FilteredList(values,
-                                getinstance(self._instance),
-                                self._name)
-        else:
-            return values and values[0]
-    return inner
+            return self._clone(values)
+        return values and values[0]
 
+    def _item_fields(self):
+        return self._instance._fields[self._name].field.document_type
 
-def _create(self):
-    def inner(*args, **kwargs):
-        instance = self._instance
-        Item = instance._fields[self._name].field.document_type_obj
-        item = Item(**kwargs)
-        self.append(item)
-        instance.save()
-        return item
-    return inner
+    def _db_name(self):
+        return self._instance._fields[self._name].db_field
 
+    def _raw(self, values):
+        """values of the items as stored in MongoDB"""
+        document_type = self._item_fields()
+        raw = {}
+        for name, value in values.items():
+            field = document_type._fields[name]
+            raw[field.db_field] = field.to_mongo(value)
+        return raw
 
-def update_item(item, new_values):
-    if not isinstance(new_values, dict):
-        return
-    for k, v in new_values.items():
-        setattr(item, k, v)
+    def _write(self, operation, spec=None):
+        """run operation on the parent document, False when it was never
+        saved and has to be saved as a whole"""
+        instance = self._instance
+        if instance is None or getattr(instance, 'pk', None) is None:
+            return False
+        query = {'_id': instance.pk}
+        query.update(spec or {})
+        field = instance._fields.get('updated_at')
+        if field is not None:
+            now = datetime.datetime.now()
+            operation.setdefault('$set', {})[field.db_field] = now
+            instance._data['updated_at'] = now
+        instance._get_collection().update(query, operation)
+        signals.post_save.send(instance.__class__, document=instance,
+                               created=False)
+        return True
+
+    def create(self, *args, **kwargs):
+        item = self._item_fields()(**kwargs)
+        item.validate()
+        list.append(self, item)
+        self._indexes = {}
+        if not self._write({'$push': {self._db_name(): item.to_mongo()}}):
+            self._mark_as_changed()
+            self._instance.save()
+        return item
 
+    def update(self, new_values, **kwargs):
+        values = self._matches(kwargs)
+        if not values or not isinstance(new_values, dict):
+            return self._result(values)
 
-def _update(self):
-    def inner(new_values, **kwargs):
-        values = only_matches(self, kwargs)
+        name = self._db_name()
+        raw = self._raw(new_values)
         for item in values:
-            update_item(item, new_values)
-        self._instance.save()
-        self._instance.reload()
-        if len(values) > 1:
-            return FilteredList(values,
-                                getinstance(self._instance),
-                                self._name)
+            for key, value in new_values.items():
+                setattr(item, key, value)
+            item._changed_fields = [field for field in item._changed_fields
+                                    if field not in raw]
+        self._indexes = {}
+
+        if len(values) == 1 and kwargs:
+            # positional $set of the first element matching the criteria
+            written = self._write(
+                {'$set': dict(('{0}.$.{1}'.format(name, key), value)
+                              for key, value in raw.items())},
+                {name: {'$elemMatch': self._raw(kwargs)}})
         else:
-            return values and values[0]
-    return inner
-
-
-def _count(self):
-    def inner(*args, **kwargs):
-        return len(self)
-    return inner
-
-
-def inject(obj):
-    setattr(obj, 'filter', _filter(obj))
-    setattr(obj, 'get', _get(obj))
-    setattr(obj, 'delete', _delete(obj))
-    setattr(obj, 'create', _create(obj))
-    setattr(obj, 'exclude', _exclude(obj))
-    setattr(obj, 'count', _count(obj))
-    setattr(obj, 'update', _update(obj))
-
-
-class FilteredList(BaseList):
-    def __init__(self, *args, **kwargs):
-        super(FilteredList, self).__init__(*args, **kwargs)
-        inject(self)
+            updated = set(id(item) for item in values)
+            positions = [i for i, item in enumerate(self)
+                         if id(item) in updated]
+            written = self._write(
+                {'$set': dict(('{0}.{1}.{2}'.format(name, i, key), value)
+                              for i in positions
+                              for key, value in raw.items())})
+        if not written:
+            self._mark_as_changed()
+            self._instance.save()
+        return self._result(values)
+
+    def delete(self, *args, **kwargs):
+        values = self._matches(kwargs)
+        if not values:
+            return self._result(values)
+        removed = set(id(item) for item in values)
+        list.__setslice__(self, 0, len(self),
+                          [item for item in self if id(item) not in removed])
+        self._indexes = {}
+
+        if kwargs:
+            written = self._write(
+                {'$pull': {self._db_name(): self._raw(kwargs)}})
+        else:
+            written = self._write({'$set': {self._db_name(): []}})
+        if not written:
+            self._mark_as_changed()
+            self._instance.save()
+        return self._result(values)
 
 
 class ListField(fields.ListField):
-    def __get__(self, *args, **kwargs):
-        value = super(ListField, self).__get__(*args, **kwargs)
-        inject(value)
+    def __get__(self, instance, owner):
+        value = super(ListField, self).__get__(instance, owner)
+        if instance is not None and isinstance(value, BaseList) and \
+                not isinstance(value, FilteredList):
+            dereferenced = value._dereferenced
+            value = FilteredList(value, instance, self.name)
+            value._dereferenced = dereferenced
+            instance._data[self.name] = value
         return value
@@ -1,21 +1,32 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import re
 import json
 import logging
 import datetime
 import random
+import threading
 from flask import url_for, current_app
 from flask.ext.admin.babel import lazy_gettext
+from mongoengine import signals
+from mongoengine.base import get_document
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
 from quokka.core.db import db
-from quokka.core.fields import MultipleObjectsReturned
+from quokka.core.fields import IndexedItem
 from quokka import admin
 from quokka.core.admin import _, _l
 from quokka.core.admin.models import ModelAdmin
 from quokka.core.admin.ajax import AjaxModelLoader
+from quokka.core.tree import channel_tree, ref_id
+from quokka.core.config import config_registry
+from quokka.core.cache import channel_tag, content_tag
+from quokka.core.bus import invalidation_bus
+from quokka.core.pagination import paginate
 from quokka.modules.accounts.models import User
 from quokka.utils.text import slugify
-from quokka.utils import get_current_user
+from quokka.utils import get_current_user, batches, dedupe
 
 logger = logging.getLogger()
 
@@ -35,6 +46,13 @@ class Owned(object):
     created_by = db.ReferenceField(User)
     last_updated_by = db.ReferenceField(User)
 
+    def set_owner(self, name, user):
+        """set a user reference field, plain setattr dereferences
+        the previous value first"""
+        if ref_id(self._data.get(name)) != ref_id(user):
+            self._data[name] = user
+            self._mark_as_changed(name)
+
 
 class Publishable(Dated, Owned):
     published = db.BooleanField(default=False)
@@ -42,10 +60,10 @@ class Publishable(Dated, Owned):
     def save(self, *args, **kwargs):
         self.updated_at = datetime.datetime.now()
 
-        user = get_current_user()
+        user = get_current_user(reference=True)
         if not self.id:
-            self.created_by = user
-        self.last_updated_by = user
+            self.set_owner('created_by', user)
+        self.set_owner('last_updated_by', user)
 
         super(Publishable, self).save(*args, **kwargs)
 
@@ -60,9 +78,39 @@ class Slugged(object):
             self.slug = slugify(title or self.title)
 
 
+def mpath_ancestors(mpath):
+    """every mpath prefix of mpath, root first, mpath itself included
+    >>> mpath_ancestors(',articles,technology,')
+    [',articles,', ',articles,technology,']
+    """
+    slugs = mpath.strip(',').split(',')
+    return [",{0},".format(",".join(slugs[:i + 1]))
+            for i in range(len(slugs))]
+
+
+def mpath_long_slug(mpath):
+    """
+    >>> mpath_long_slug(',articles,technology,')
+    'articles/technology'
+    """
+    return "/".join(mpath.strip(',').split(','))
+
+
+def descendants_query(mpath):
+    """raw query for documents under the channel of mpath (included)
+    MPATH_QUERY_STRATEGY 'regex' uses an anchored prefix regex on mpath,
+    'ancestors' an equality match on the ancestor_mpaths array"""
+    strategy = current_app.config.get('MPATH_QUERY_STRATEGY', 'regex')
+    if strategy == 'ancestors':
+        return {'ancestor_mpaths': mpath}
+    return {'mpath': {'$regex': '^{0}'.format(re.escape(mpath))}}
+
+
 class LongSlugged(Slugged):
     long_slug = db.StringField(unique=True, required=True)
     mpath = db.StringField()
+    # mpaths of all channels above the document (channels include self)
+    ancestor_mpaths = db.ListField(db.StringField())
 
     def _create_mpath_long_slug(self):
         if isinstance(self, Channel):
@@ -82,6 +130,12 @@ class LongSlugged(Slugged):
             )
             self.mpath = "".join([self.channel.mpath, self.slug, ','])
 
+    def _create_ancestor_mpaths(self):
+        ancestors = mpath_ancestors(self.mpath)
+        if not isinstance(self, Channel):
+            ancestors.pop()
+        self.ancestor_mpaths = ancestors
+
     def validate_long_slug(self):
         self._create_mpath_long_slug()
 
@@ -100,8 +154,11 @@ class LongSlugged(Slugged):
                                  slug=self.long_slug)
                 )
 
+        self._create_ancestor_mpaths()
 
-class Comment(db.EmbeddedDocument):
+
+class Comment(db.Document):
+    content = db.ReferenceField('Content', required=True)
     body = db.StringField(verbose_name="Comment", required=True)
     author = db.StringField(verbose_name="Name", max_length=255, required=True)
     published = db.BooleanField(default=True)
@@ -111,21 +168,77 @@ class Comment(db.EmbeddedDocument):
     def __unicode__(self):
         return "{0}-{1}...".format(self.author, self.body[:10])
 
+    def delete(self, *args, **kwargs):
+        # not a post_delete receiver, a content deleted with its comments
+        # (CASCADE) removes them in one query instead of one by one
+        super(Comment, self).delete(*args, **kwargs)
+        comment_changed(Comment, self, delta=-1 if self.published else 0)
+
     meta = {
-        'indexes': ['-created_at', '-available_at'],
+        'indexes': [('content', '-created_at', '-id')],
         'ordering': ['-created_at']
     }
 
 
+def recount_comments(*content_ids):
+    """set Content.comment_count to the published comments of contents,
+    for bulk updates and repairs, a single comment only increments it"""
+    for pk in content_ids:
+        Content.objects(pk=pk).update_one(set__comment_count=Comment.objects(
+            content=pk, published=True).count())
+
+
+def count_comment(sender, document, created, **kwargs):
+    """how much the save changes the published comments of the content"""
+    if created:
+        delta = 1 if document.published else 0
+    elif 'published' in document._get_changed_fields():
+        delta = 1 if document.published else -1
+    else:
+        delta = 0
+    document._comment_delta = delta
+
+
+def comment_changed(sender, document, delta=None, **kwargs):
+    """keep Content.comment_count in sync and purge the pages of the
+    content, a comment can be published or hidden after it was created"""
+    if delta is None:
+        delta = document.__dict__.pop('_comment_delta', 0)
+    content_id = ref_id(document._data.get('content'))
+    if delta:
+        Content.objects(pk=content_id).update_one(
+            inc__comment_count=delta)
+    content = Content.objects(pk=content_id).only('channel').first()
+    if content is not None:
+        purge_content_cache(Content, content)
+
+
+signals.pre_save_post_validation.connect(count_comment, sender=Comment)
+signals.post_save.connect(comment_changed, sender=Comment)
+
+
 class Commentable(object):
-    comments = db.ListField(db.EmbeddedDocumentField(Comment))
+    """comments live in their own collection, the content only stores
+    how many it has"""
+    comment_count = db.IntField(default=0)
+
+    def get_comments(self, cursor=None, per_page=None):
+        return paginate(Comment.objects(content=self, published=True),
+                        cursor=cursor, per_page=per_page)
+
+    def add_comment(self, comment):
+        comment.content = self
+        comment.save()
+        if comment.published:
+            self.comment_count += 1
+        return comment
 
 
 class Tagged(object):
     tags = db.ListField(db.StringField(max_length=50))
 
 
-class CustomValue(db.EmbeddedDocument):
+class CustomValue(IndexedItem, db.EmbeddedDocument):
 
     FORMATS = (
         ('json', "json"),
@@ -209,9 +322,23 @@ class TemplateType(HasCustomValue):
     def __unicode__(self):
         return self.title
 
+    def update_theme_chains(self):
+        """rewrite the theme_chain of what uses this type"""
+
+    def save(self, *args, **kwargs):
+        theme_changed = not self._created and \
+            'theme_name' in self._get_changed_fields()
+        super(TemplateType, self).save(*args, **kwargs)
+        if theme_changed:
+            self.update_theme_chains()
+
 
 class ChannelType(TemplateType, ChannelConfigs, db.DynamicDocument):
     """Define the channel template type and its filters"""
+    per_page = db.IntField(required=False)
+
+    def update_theme_chains(self):
+        Channel.rebuild_theme_chains(channel_tree.get_all())
 
 
 class ContentProxy(db.DynamicDocument):
@@ -243,6 +370,14 @@ class Channel(HasCustomValue, Publishable, LongSlugged,
                                        required=False,
                                        reverse_delete_rule=db.NULLIFY)
 
+    # theme names of the channel type and of the ancestors, nearest first
+    # None for channels saved before it existed, see get_themes
+    theme_chain = db.ListField(db.StringField(), default=None)
+
+    meta = {
+        'indexes': ['mpath', 'ancestor_mpaths']
+    }
+
     def get_content_filters(self):
         filters = {}
         if self.channel_type and self.channel_type.content_filters:
@@ -251,6 +386,14 @@ class Channel(HasCustomValue, Publishable, LongSlugged,
             filters.update(self.content_filters)
         return filters
 
+    def get_per_page(self):
+        """number of contents per page in channel listing
+        falls back to PAGINATION_PER_PAGE when channel_type does not define
+        """
+        if self.channel_type and self.channel_type.per_page:
+            return self.channel_type.per_page
+        return current_app.config.get('PAGINATION_PER_PAGE', 10)
+
     def get_ancestors_slugs(self):
         """return ancestors slugs including self as 1st item
         >>> channel = Channel(long_slug='articles/technology/programming')
@@ -285,28 +428,62 @@ class Channel(HasCustomValue, Publishable, LongSlugged,
     def get_descendants(self, **kwargs):
         """return all descendants including self as 1st item"""
         return self.__class__.objects(
-            __raw__={'mpath': {'$regex': '^{0}'.format(self.mpath)}}
+            __raw__=descendants_query(self.mpath)
         ).order_by('long_slug')
 
     def get_themes(self):
-        return list({
-            c.channel_type.theme_name
-            for c in self.get_ancestors(channel_type__ne=None)
-            if c.channel_type and c.channel_type.theme_name
-        })
+        if self.theme_chain is not None:
+            return list(self.theme_chain)
+        return channel_tree.get_themes(self)
+
+    def build_theme_chain(self):
+        parent = self.parent
+        return dedupe(
+            [self.channel_type and self.channel_type.theme_name] +
+            (parent.get_themes() if parent else [])
+        )
+
+    @classmethod
+    def rebuild_theme_chains(cls, channels, changed=()):
+        """recompute the theme_chain of channels (of the channel tree,
+        parents first) and of their contents, only the changed chains
+        are written. returns the number of channels whose chain changed
+        """
+        changed = set(changed)
+        chains = {}
+        for channel in channels:
+            parent = channel._data.get('parent')
+            if parent is None:
+                parent_chain = []
+            else:
+                parent_chain = chains[parent.pk] if parent.pk in chains \
+                    else parent.get_themes()
+            chain = chains[channel.pk] = dedupe(
+                [channel.channel_type and channel.channel_type.theme_name] +
+                parent_chain)
+            if chain != channel.theme_chain:
+                cls.objects(pk=channel.pk).update_one(set__theme_chain=chain)
+                changed.add(channel.pk)
+
+        if changed:
+            template_themes = ContentTemplateType.get_theme_names()
+            for pk in changed:
+                Content.update_theme_chains(pk, chains[pk], template_themes)
+            invalidation_bus.channels_changed()
+            invalidation_bus.purge_all()
+        return len(changed)
 
     @classmethod
     def get_homepage(cls, attr=None):
-        try:
-            homepage = cls.objects.get(is_homepage=True)
-        except Exception as e:
-            logger.info("There is no homepage: %s" % e.message)
+        """the homepage channel from the channel tree, loaded once per
+        tree version instead of queried on every request"""
+        homepage = channel_tree.homepage
+        if homepage is None:
+            logger.info("There is no homepage")
             return None
-        else:
-            if not attr:
-                return homepage
-            else:
-                return getattr(homepage, attr, homepage)
+        if not attr:
+            return homepage
+        return getattr(homepage, attr, homepage)
 
     def __unicode__(self):
         return self.long_slug
@@ -341,22 +518,60 @@ class Channel(HasCustomValue, Publishable, LongSlugged,
         self.channel_type = self.channel_type or parent.channel_type
 
     def update_descendants_and_contents(self):
-        """TODO:
-        Detect if self.long_slug and self.mpath has changed.
-        if so, update every descendant using get_descendatns method
-        to query.
-        Also update long_slug and mpath for every Content in this channel
-        This needs to be done by default in araw immediate way, but if
-        current_app.config.get('ASYNC_SAVE_MODE') is True it will delegate
-        all those tasks to celery."""
+        """when the mpath of the channel changed (slug or parent) record a
+        ChannelMove, started by save once the channel is written, which
+        moves descendant channels and contents to the new mpath"""
+        if self._created or not set(self._get_changed_fields()) & \
+                set(['slug', 'parent', 'long_slug', 'mpath']):
+            return None
+        stored = Channel._get_collection().find_one(
+            {'_id': self.pk}, {'mpath': True, 'long_slug': True})
+        if not stored or stored.get('mpath') in (None, self.mpath):
+            return None
+        if self.mpath.startswith(stored['mpath']):
+            raise db.ValidationError(
+                lazy_gettext("A channel can not be moved under itself"))
+        return ChannelMove(channel=self,
+                           old_mpath=stored['mpath'],
+                           new_mpath=self.mpath,
+                           old_long_slug=stored.get('long_slug'),
+                           new_long_slug=self.long_slug).save()
 
     def save(self, *args, **kwargs):
         self.validate_render_content()
         self.validate_slug()
         self.validate_long_slug()
         self.heritage()
-        self.update_descendants_and_contents()
-        super(Channel, self).save(*args, **kwargs)
+        chain = self.build_theme_chain()
+        # a new channel has no descendants nor contents to update
+        chain_changed = chain != self.theme_chain and not self._created
+        self.theme_chain = chain
+        move = self.update_descendants_and_contents()
+        try:
+            super(Channel, self).save(*args, **kwargs)
+        except Exception:
+            if move:
+                move.delete()
+            raise
+        if move:
+            # the move rebuilds the chains of the subtree
+            move.start()
+        elif chain_changed:
+            # the channel tree was invalidated by post_save
+            Channel.rebuild_theme_chains(channel_tree.get_descendants(self),
+                                         changed=[self.pk])
+
+
+signals.post_save.connect(invalidation_bus.channels_changed, sender=Channel)
+signals.post_delete.connect(invalidation_bus.channels_changed, sender=Channel)
+signals.post_save.connect(invalidation_bus.channels_changed,
+                          sender=ChannelType)
+signals.post_delete.connect(invalidation_bus.channels_changed,
+                            sender=ChannelType)
+
+for sender in (Channel, ChannelType):
+    signals.post_save.connect(invalidation_bus.purge_all, sender=sender)
+    signals.post_delete.connect(invalidation_bus.purge_all, sender=sender)
 
 
 class Channeling(object):
@@ -379,34 +594,18 @@ class Config(HasCustomValue, Publishable, db.DynamicDocument):
 
     @classmethod
     def get(cls, group, name=None, default=None):
-        instance = cls.objects.get(group=group)
-        if not name:
-            ret = instance.values
-        else:
-            try:
-                ret = instance.values.get(name=name).value
-            except MultipleObjectsReturned:
-                ret = None
-
-        return ret or default
-
-    def save(self, *args, **kwargs):
-        super(Config, self).save(*args, **kwargs)
-
-        # Try to update the config for the running app
-        # AFAIK Flask apps are not thread safe
-        # TODO: do it in a signal
-        try:
-            if self.group == 'settings':
-                _settings = {i.name: i.value for i in self.values}
-                current_app.config.update(_settings)
-        except:
-            logger.warning("Cant update app settings")
+        return config_registry.get(group, name, default)
 
     def __unicode__(self):
         return self.group
 
 
+signals.post_save.connect(invalidation_bus.config_changed, sender=Config)
+signals.post_delete.connect(invalidation_bus.config_changed, sender=Config)
+signals.post_save.connect(invalidation_bus.purge_all, sender=Config)
+signals.post_delete.connect(invalidation_bus.purge_all, sender=Config)
+
+
 class Quokka(Dated, Slugged, db.DynamicDocument):
     """ Hidden collection """
 
@@ -414,6 +613,29 @@ class Quokka(Dated, Slugged, db.DynamicDocument):
 class ContentTemplateType(TemplateType, db.Document):
     """Define the content template type and its theme"""
 
+    @classmethod
+    def get_theme_names(cls):
+        """{id: theme_name} of every type, they are a handful"""
+        return dict(cls.objects.scalar('id', 'theme_name'))
+
+    def update_theme_chains(self):
+        contents = Content._get_collection().find({'template_type': self.pk})
+        for channel_id in contents.distinct('channel'):
+            channel = channel_tree.get(channel_id)
+            Content.objects(channel=channel_id, template_type=self).update(
+                set__theme_chain=dedupe(
+                    [self.theme_name] +
+                    (channel.get_themes() if channel else [])))
+        invalidation_bus.purge_all()
+
+
+# template_suffix of types is part of the template fallback chain
+for sender in (ChannelType, ContentTemplateType):
+    signals.post_save.connect(invalidation_bus.templates_changed,
+                              sender=sender)
+    signals.post_delete.connect(invalidation_bus.templates_changed,
+                                sender=sender)
+
 
 class SubContentPurpose(db.Document):
     title = db.StringField(max_length=255, required=True)
@@ -428,7 +650,7 @@ class SubContentPurpose(db.Document):
         return self.title
 
 
-class SubContent(Publishable, Ordered, db.EmbeddedDocument):
+class SubContent(IndexedItem, Publishable, Ordered, db.EmbeddedDocument):
     """Content can have inner contents
     Its useful for any kind of relation with Content childs
     Images, ImageGalleries, RelatedContent, Attachments, Media
@@ -465,13 +687,48 @@ class Content(HasCustomValue, Publishable, LongSlugged, Commentable,
                                       reverse_delete_rule=db.NULLIFY)
     contents = db.ListField(db.EmbeddedDocumentField(SubContent))
     model = db.StringField()
+    # theme of the template type then the theme chain of the channel
+    theme_chain = db.ListField(db.StringField(), default=None)
 
     meta = {
         'allow_inheritance': True,
-        'indexes': ['-created_at', 'slug'],
+        # listings query every content type, their indexes do not start
+        # with _cls (added by allow_inheritance) ahead of the prefixes
+        'indexes': [
+            '-created_at',
+            'slug',
+            {'fields': ['-created_at', '-id'], 'cls': False},
+            {'fields': ['mpath', 'published', 'available_at', '-created_at'],
+             'cls': False},
+            {'fields': ['ancestor_mpaths', 'published', '-created_at', '-id'],
+             'cls': False}
+        ],
         'ordering': ['-created_at']
     }
 
+    # fields left out when contents are loaded for a given use,
+    # subclasses add their own heavy fields, see get_projection
+    projections = {
+        'list': ('contents', 'values'),
+        'detail': (),
+        'feed': ('contents', 'values'),
+        'sitemap': ('summary', 'contents', 'values', 'tags',
+                    'related_channels')
+    }
+
+    @classmethod
+    def get_projection(cls, profile):
+        """fields to exclude for profile in a query on cls,
+        which can return documents of any of its subclasses
+        >>> Content.objects.exclude(*Content.get_projection('list'))
+        """
+        classes = [cls] + [get_document(name)
+                           for name in cls._subclasses[1:]]
+        excluded = set()
+        for klass in classes:
+            excluded.update(klass.projections.get(profile, ()))
+        return sorted(excluded)
+
     def get_main_image_url(self, thumb=False, default=None):
         try:
             main_image = SubContentPurpose.objects.get(identifier='mainimage')
@@ -488,11 +745,35 @@ class Content(HasCustomValue, Publishable, LongSlugged, Commentable,
         return str(self.id)
 
     def get_themes(self):
-        themes = self.channel.get_themes()
-        theme = self.template_type and self.template_type.theme_name
-        if theme:
-            themes.insert(0, theme)
-        return list(set(themes))
+        if self.theme_chain is not None:
+            return list(self.theme_chain)
+        return self.build_theme_chain()
+
+    def build_theme_chain(self, template_themes=None):
+        """template_themes is {id: theme_name} of the template types,
+        when not given the template type is loaded"""
+        channel = channel_tree.get(ref_id(self._data.get('channel')))
+        template_type = ref_id(self._data.get('template_type'))
+        if template_type is None:
+            theme = None
+        elif template_themes is not None:
+            theme = template_themes.get(template_type)
+        else:
+            theme = self.template_type and self.template_type.theme_name
+        return dedupe([theme] + (channel.get_themes() if channel else []))
+
+    @classmethod
+    def update_theme_chains(cls, channel_id, channel_chain,
+                            template_themes):
+        """rewrite the theme_chain of the contents of a channel"""
+        themed = dict((pk, name) for pk, name in template_themes.items()
+                      if name)
+        cls.objects(channel=channel_id,
+                    template_type__nin=themed.keys()).update(
+            set__theme_chain=channel_chain)
+        for pk, name in themed.items():
+            cls.objects(channel=channel_id, template_type=pk).update(
+                set__theme_chain=dedupe([name] + channel_chain))
 
     def get_absolute_url(self, endpoint='detail'):
         if self.channel.is_homepage:
@@ -525,13 +806,441 @@ class Content(HasCustomValue, Publishable, LongSlugged, Commentable,
         self.validate_slug()
         self.validate_long_slug()
         self.heritage()
+        self.theme_chain = self.build_theme_chain()
         super(Content, self).save(*args, **kwargs)
 
+    def prepare_bulk_save(self, user, now):
+        """what save does before writing, but the queries"""
+        self.updated_at = now
+        if user and self._created:
+            self.set_owner('created_by', user)
+        if user:
+            self.set_owner('last_updated_by', user)
+        self.validate_slug()
+        self._create_mpath_long_slug()
+        self._create_ancestor_mpaths()
+        self.heritage()
+
+    @classmethod
+    def bulk_save(cls, documents, user=None):
+        """save many contents with a single slug query and a single
+        unordered bulk write, user defaults to the current user.
+        post_save signals are not sent, the response cache is purged once.
+        returns (document, error) for every document not saved
+        """
+        documents = list(documents)
+        if not documents:
+            return []
+        user = user or get_current_user(reference=True)
+        now = datetime.datetime.now()
+        errors = []
+
+        prepared = []
+        template_themes = ContentTemplateType.get_theme_names()
+        for document in documents:
+            try:
+                document.prepare_bulk_save(user, now)
+                document.theme_chain = document.build_theme_chain(
+                    template_themes)
+                document.validate()
+            except (db.ValidationError, ValueError) as e:
+                errors.append((document, e))
+            else:
+                prepared.append(document)
+
+        # long_slug is unique in the whole collection, one lookup for all
+        taken = dict(Content.objects(
+            long_slug__in=[document.long_slug for document in prepared]
+        ).scalar('long_slug', 'id'))
+        smart_slug = current_app.config.get('SMART_SLUG_ENABLED', False)
+        valid = []
+        for document in prepared:
+            owner = taken.get(document.long_slug, document.pk)
+            if owner is not None and owner != document.pk and smart_slug:
+                document.slug = "{0}-{1}".format(document.slug,
+                                                 random.getrandbits(32))
+                document._create_mpath_long_slug()
+                document._create_ancestor_mpaths()
+            elif owner is not None and owner != document.pk:
+                errors.append((document, db.ValidationError(
+                    lazy_gettext("%(slug)s slug already exists",
+                                 slug=document.long_slug))))
+                continue
+            taken[document.long_slug] = document.pk or document
+            valid.append(document)
+
+        if not valid:
+            return errors
+
+        bulk = cls._get_collection().initialize_unordered_bulk_op()
+        inserted = set()
+        written = []
+        for document in valid:
+            if document._created:
+                # setting the pk marks the document as not created
+                document.pk = document.pk or ObjectId()
+                bulk.insert(document.to_mongo())
+                inserted.add(id(document))
+                written.append(document)
+                continue
+            sets, unsets = document._delta()
+            update = {}
+            if sets:
+                update['$set'] = sets
+            if unsets:
+                update['$unset'] = unsets
+            if update:
+                bulk.find({'_id': document.pk}).update_one(update)
+                written.append(document)
+
+        failed = {}
+        if written:
+            try:
+                bulk.execute()
+            except BulkWriteError as e:
+                # index is the position of the operation in the bulk
+                for error in e.details.get('writeErrors', []):
+                    failed[error['index']] = error['errmsg']
+
+        saved = []
+        for index, document in enumerate(written):
+            if index in failed:
+                errors.append((document, failed[index]))
+                if id(document) in inserted:
+                    document.pk = None
+                    document._created = True
+                continue
+            document._clear_changed_fields()
+            document._created = False
+            saved.append(document)
+
+        created = [document for document in saved
+                   if id(document) in inserted]
+        if created:
+            signals.post_bulk_insert.send(cls, documents=created, loaded=True)
+        if saved:
+            invalidation_bus.purge_all()
+        logger.info("bulk saved {0} {1}, {2} errors".format(
+            len(saved), cls.__name__, len(errors)))
+        return errors
+
+    @classmethod
+    def bulk_move(cls, query, channel, user=None, batch_size=1000):
+        """move every content of query to channel, long_slug, mpath,
+        ancestor_mpaths and theme_chain are rebuilt with one bulk write per
+        batch_size contents. contents whose slug is taken in channel stay where
+        they are, returns (moved count, long_slugs not moved)
+        """
+        user = user or get_current_user(reference=True)
+        fields = {
+            'channel': cls._fields['channel'].to_mongo(channel),
+            'ancestor_mpaths': mpath_ancestors(channel.mpath),
+            'updated_at': datetime.datetime.now()
+        }
+        if user:
+            fields['last_updated_by'] = \
+                cls._fields['last_updated_by'].to_mongo(user)
+
+        template_themes = ContentTemplateType.get_theme_names()
+        channel_chain = channel.get_themes()
+
+        moved, skipped = 0, []
+        # read ahead, moved contents may stop matching query
+        rows = list(query.only('id', 'slug', 'template_type').as_pymongo())
+        for batch in batches(rows, batch_size):
+            for row in batch:
+                row['long_slug'] = "/".join([channel.long_slug, row['slug']])
+            taken = dict(Content.objects(
+                long_slug__in=[row['long_slug'] for row in batch]
+            ).scalar('long_slug', 'id'))
+
+            bulk = cls._get_collection().initialize_unordered_bulk_op()
+            written = []
+            for row in batch:
+                if taken.setdefault(row['long_slug'], row['_id']) != \
+                        row['_id']:
+                    skipped.append(row['long_slug'])
+                    continue
+                theme = template_themes.get(row.get('template_type'))
+                update = dict(fields, long_slug=row['long_slug'],
+                              mpath="".join([channel.mpath, row['slug'], ',']),
+                              theme_chain=dedupe([theme] + channel_chain))
+                bulk.find({'_id': row['_id']}).update_one({'$set': update})
+                written.append(row)
+            if not written:
+                continue
+
+            failed = set()
+            try:
+                bulk.execute()
+            except BulkWriteError as e:
+                failed = set(error['index']
+                             for error in e.details.get('writeErrors', []))
+            moved += len(written) - len(failed)
+            skipped.extend(written[index]['long_slug'] for index in failed)
+
+        if moved:
+            invalidation_bus.purge_all()
+        logger.info("bulk moved {0} {1} to {2}, {3} skipped".format(
+            moved, cls.__name__, channel.long_slug, len(skipped)))
+        return moved, skipped
+
+
+Content.register_delete_rule(Comment, 'content', db.CASCADE)
+
 
 class Link(Content):
     link = db.StringField(required=True)
 
 
+def purge_content_cache(sender, document, **kwargs):
+    """purge the content detail page, the listings of its channel
+    and ancestors and the homepage listing"""
+    tags = [content_tag(document.id)]
+    channel = channel_tree.get(ref_id(document._data.get('channel')))
+    if channel:
+        tags.extend(map(channel_tag, channel.get_ancestors_slugs()))
+    if channel_tree.homepage:
+        tags.append(channel_tag(channel_tree.homepage.long_slug))
+    invalidation_bus.purge(*tags)
+
+
+def connect_content_signals():
+    """connect the receivers of contents to Content and every subclass,
+    mongoengine signals are sent by the class of the document. called
+    again once the modules defining more contents are loaded"""
+    for name in Content._subclasses:
+        sender = get_document(name)
+        signals.post_save.connect(purge_content_cache, sender=sender)
+        signals.post_delete.connect(purge_content_cache, sender=sender)
+
+
+connect_content_signals()
+
+
+class ChannelMove(db.Document):
+    """a channel whose mpath changed (renamed or moved), its descendant
+    channels and contents are rewritten by run in batches of bulk updates.
+
+    documents still under old_mpath are the work left, so an interrupted
+    move is resumed by the next run_pending (a save of a moved channel or
+    `python manage.py run_channel_moves`). a process holds the move it
+    runs for `lease` seconds. moves run oldest first, a move waits while
+    an older unfinished one moves the same part of the tree, a failed one
+    keeps it waiting until it is retried
+    """
+    channel = db.ReferenceField(Channel)
+    old_mpath = db.StringField(required=True)
+    new_mpath = db.StringField(required=True)
+    old_long_slug = db.StringField()
+    new_long_slug = db.StringField()
+    # new: the channel is being saved, pending: ready to run
+    status = db.StringField(default='new',
+                            choices=('new', 'pending', 'running', 'done',
+                                     'failed'))
+    channels = db.IntField(default=0)
+    contents = db.IntField(default=0)
+    # documents whose new long_slug is taken, they stay where they were
+    skipped = db.ListField(db.ObjectIdField())
+    error = db.StringField()
+    created_at = db.DateTimeField(default=datetime.datetime.now)
+    updated_at = db.DateTimeField(default=datetime.datetime.now)
+    locked_until = db.DateTimeField()
+
+    meta = {
+        'indexes': [('status', 'created_at')],
+        'ordering': ['created_at']
+    }
+
+    lease = 300
+
+    def __unicode__(self):
+        return u"{0} -> {1} {2}".format(self.old_long_slug,
+                                        self.new_long_slug, self.status)
+
+    def overlaps(self, other):
+        """moves of the same part of the tree have to run in order"""
+        paths = (self.old_mpath, self.new_mpath)
+        return any(path.startswith(other_path) or
+                   other_path.startswith(path)
+                   for path in paths
+                   for other_path in (other.old_mpath, other.new_mpath))
+
+    def get_query(self):
+        return {'mpath': {'$regex': '^{0}'.format(re.escape(self.old_mpath))},
+                '_id': {'$nin': list(self.skipped)}}
+
+    def start(self):
+        """the channel is saved, run the move or hand it to a worker"""
+        self.status = 'pending'
+        self.update(set__status='pending')
+        config = current_app.config
+        if config.get('ASYNC_SAVE_MODE') is True:
+            from quokka.core.tasks import run_channel_moves
+            run_channel_moves.delay()
+            return
+
+        limit = config.get('CHANNEL_MOVE_INLINE_LIMIT', 1000)
+        cursor = Content._get_collection().find(self.get_query(), {'_id': 1})
+        if cursor.limit(limit + 1).count(with_limit_and_skip=True) <= limit:
+            ChannelMove.run_pending()
+            return
+
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                ChannelMove.run_pending()
+
+        thread = threading.Thread(target=run, name='channel-move')
+        thread.daemon = True
+        thread.start()
+
+    def claim(self):
+        now = datetime.datetime.now()
+        return ChannelMove.objects(
+            pk=self.pk,
+            __raw__={'$or': [{'locked_until': None},
+                             {'locked_until': {'$lt': now}}]}
+        ).update_one(set__locked_until=now + datetime.timedelta(
+            seconds=self.lease))
+
+    def check_saved(self):
+        """a move left new by a process which stopped while saving its
+        channel: pending if the channel was saved, deleted (status None)
+        otherwise"""
+        age = datetime.datetime.now() - self.created_at
+        if age < datetime.timedelta(seconds=self.lease):
+            return
+        stored = Channel._get_collection().find_one(
+            {'_id': ref_id(self._data.get('channel'))}, {'mpath': True})
+        if stored and stored.get('mpath') != self.old_mpath:
+            self.update(set__status='pending')
+            self.status = 'pending'
+            return
+        logger.warning("Channel move {0} dropped, its channel was not "
+                       "saved".format(self))
+        self.delete()
+        self.status = None
+
+    def rewrite(self, model, batch_size):
+        """move the documents of model under old_mpath to new_mpath"""
+        collection = model._get_collection()
+        is_channel = issubclass(model, Channel)
+        while True:
+            rows = list(collection.find(self.get_query(),
+                                        {'mpath': True}).limit(batch_size))
+            if not rows:
+                return
+
+            bulk = collection.initialize_unordered_bulk_op()
+            tags = []
+            for row in rows:
+                mpath = self.new_mpath + row['mpath'][len(self.old_mpath):]
+                ancestors = mpath_ancestors(mpath)
+                if not is_channel:
+                    ancestors.pop()
+                long_slug = mpath_long_slug(mpath)
+                bulk.find({'_id': row['_id'], 'mpath': row['mpath']}) \
+                    .update_one({'$set': {'mpath': mpath,
+                                          'long_slug': long_slug,
+                                          'ancestor_mpaths': ancestors}})
+                if is_channel:
+                    tags.append(channel_tag(long_slug))
+                    tags.append(channel_tag(mpath_long_slug(row['mpath'])))
+                else:
+                    tags.append(content_tag(row['_id']))
+
+            failed = []
+            try:
+                bulk.execute()
+            except BulkWriteError as e:
+                failed = [rows[error['index']]['_id']
+                          for error in e.details.get('writeErrors', [])]
+            self.skipped.extend(failed)
+            done = len(rows) - len(failed)
+            counter = 'channels' if is_channel else 'contents'
+            setattr(self, counter, getattr(self, counter) + done)
+            now = datetime.datetime.now()
+            self.update(**{
+                'inc__' + counter: done,
+                'add_to_set__skipped': failed,
+                'set__updated_at': now,
+                'set__locked_until': now + datetime.timedelta(
+                    seconds=self.lease)
+            })
+            invalidation_bus.purge(*tags)
+
+    def run(self, batch_size=1000):
+        self.update(set__status='running')
+        try:
+            self.rewrite(Channel, batch_size)
+            invalidation_bus.channels_changed()
+            # the channel tree now has the subtree at its new place
+            channel = channel_tree.get(ref_id(self._data.get('channel')))
+            if channel:
+                # its own chain was written by save, not its contents
+                Channel.rebuild_theme_chains(
+                    channel_tree.get_descendants(channel),
+                    changed=[channel.pk])
+            self.rewrite(Content, batch_size)
+        except Exception as e:
+            logger.exception("Channel move {0} failed".format(self))
+            self.update(set__status='failed', set__error=str(e),
+                        unset__locked_until=True)
+            self.status = 'failed'
+            return
+
+        # listings of the ancestors at both places and of the homepage
+        slugs = map(mpath_long_slug, mpath_ancestors(self.old_mpath) +
+                    mpath_ancestors(self.new_mpath))
+        if channel_tree.homepage:
+            slugs.append(channel_tree.homepage.long_slug)
+        invalidation_bus.purge(*map(channel_tag, slugs))
+        self.update(set__status='done',
+                    set__updated_at=datetime.datetime.now(),
+                    unset__locked_until=True)
+        self.status = 'done'
+        logger.info("Channel move {0}: {1} channels and {2} contents moved, "
+                    "{3} skipped".format(self, self.channels, self.contents,
+                                         len(self.skipped)))
+
+    @classmethod
+    def next_runnable(cls):
+        """oldest move which is ready and not held, nor waiting for an
+        older move of the same part of the tree"""
+        waiting = []
+        for move in cls.objects(status__ne='done'):
+            if any(move.overlaps(older) for older in waiting):
+                waiting.append(move)
+                continue
+            if move.status == 'new':
+                move.check_saved()
+                if move.status is None:
+                    continue
+            # failed, new or held by another process
+            if move.status in ('failed', 'new') or not move.claim():
+                waiting.append(move)
+                continue
+            return move
+        return None
+
+    @classmethod
+    def run_pending(cls, batch_size=1000):
+        """run the unfinished moves which can run, returns when the others
+        are held, failed or wait for one of them"""
+        while True:
+            move = cls.next_runnable()
+            if move is None:
+                return
+            move.run(batch_size)
+
+    @classmethod
+    def retry_failed(cls):
+        return cls.objects(status='failed').update(
+            set__status='pending', unset__error=True)
+
+
 ###############################################################
 # General Content admin
 ###############################################################
@@ -547,12 +1256,43 @@ admin.register(Content, ContentAdmin,
 class LinkAdmin(ModelAdmin):
     roles_accepted = ('admin', 'editor', 'writer', 'moderator')
     column_list = ('title', 'channel', 'slug', 'published')
+    column_prefetch = ('channel',)
     form_columns = ('title', 'slug', 'channel', 'link', 'contents',
                     'values', 'available_at', 'available_until', 'published')
 
 admin.register(Link, LinkAdmin, category=_("Content"), name=_l("Link"))
 
 
+class CommentAdmin(ModelAdmin):
+    roles_accepted = ('admin', 'editor', 'moderator')
+    column_list = ('content', 'author', 'body', 'published', 'created_at')
+    column_prefetch = ('content',)
+    column_filters = ('published', 'author')
+    column_searchable_list = ('author', 'body')
+    column_formatters = {'created_at': ModelAdmin.formatters.get('datetime')}
+    form_columns = ('author', 'body', 'published')
+
+    def bulk_delete(self, query):
+        """comment_changed is not called, recount the contents"""
+        contents = set(ref_id(content) for content in
+                       query.no_dereference().scalar('content'))
+        super(CommentAdmin, self).bulk_delete(query)
+        recount_comments(*contents)
+
+    def update_published(self, query, published):
+        """published is set in bulk, recount the contents"""
+        contents = set(ref_id(content) for content in
+                       query.filter(published__ne=published)
+                       .no_dereference().scalar('content'))
+        count = super(CommentAdmin, self).update_published(query, published)
+        recount_comments(*contents)
+        return count
+
+
+admin.register(Comment, CommentAdmin,
+               category=_("Content"), name=_l("Comment"))
+
+
 ###############################################################
 # Admin views
 ###############################################################
@@ -598,6 +1338,7 @@ class ChannelAdmin(ModelAdmin):
     roles_accepted = ('admin', 'editor')
     column_list = ('title', 'long_slug', 'is_homepage',
                    'channel_type', 'created_at', 'available_at', 'published')
+    column_prefetch = ('channel_type',)
     column_filters = ['published', 'is_homepage', 'include_in_rss',
                       'show_in_menu', 'indexable']
     column_searchable_list = ('title', 'description')
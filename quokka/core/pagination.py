@@ -0,0 +1,150 @@
+# coding: utf-8
+
+"""
+Keyset (cursor) pagination for content listings.
+
+Pages are sorted by ``(-created_at, -_id)`` and every page is fetched with
+a range query over those two fields instead of ``skip``, so page 1000 costs
+the same as page one as long as the collection has an index on
+``(-created_at, -_id)``.
+
+Cursors are opaque url-safe tokens, pass them back untouched::
+
+    page = CursorPaginator(Content.objects(published=True), 10).page(
+        request.args.get('cursor')
+    )
+    for content in page:
+        ...
+    page.next_cursor, page.prev_cursor
+"""
+
+import base64
+import logging
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import current_app
+
+logger = logging.getLogger()
+
+NEXT = 'n'
+PREV = 'p'
+DATETIME_FORMAT = "%Y%m%d%H%M%S%f"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, created_at, pk):
+    raw = "{0}|{1}|{2}".format(direction,
+                               created_at.strftime(DATETIME_FORMAT),
+                               pk)
+    return base64.urlsafe_b64encode(raw).rstrip('=')
+
+
+def decode_cursor(token):
+    """returns (direction, created_at, ObjectId) for a cursor token
+    raises InvalidCursor for anything forged or truncated"""
+    try:
+        token = str(token)
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, created_at, pk = raw.split('|')
+        if direction not in (NEXT, PREV):
+            raise ValueError(direction)
+        return (direction,
+                datetime.strptime(created_at, DATETIME_FORMAT),
+                ObjectId(pk))
+    except (TypeError, ValueError, InvalidId) as e:
+        raise InvalidCursor("Invalid cursor {0}: {1}".format(token, e))
+
+
+def get_per_page(default=None):
+    return default or current_app.config.get('PAGINATION_PER_PAGE', 10)
+
+
+class CursorPage(object):
+    """A page of documents, iterable in display order"""
+
+    def __init__(self, items, has_next=False, has_prev=False):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.items:
+            last = self.items[-1]
+            return encode_cursor(NEXT, last.created_at, last.pk)
+
+    @property
+    def prev_cursor(self):
+        if self.has_prev and self.items:
+            first = self.items[0]
+            return encode_cursor(PREV, first.created_at, first.pk)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __nonzero__(self):
+        return bool(self.items)
+
+
+class CursorPaginator(object):
+    """Paginates a queryset over (-created_at, -_id) without skip"""
+
+    def __init__(self, queryset, per_page=None):
+        self.queryset = queryset
+        self.per_page = get_per_page(per_page)
+
+    def _range_query(self, operator, created_at, pk):
+        return {
+            '$or': [
+                {'created_at': {operator: created_at}},
+                {'created_at': created_at, '_id': {operator: pk}}
+            ]
+        }
+
+    def page(self, cursor=None):
+        """returns the CursorPage for cursor, invalid or missing cursors
+        fall back to the first page"""
+        direction = None
+        if cursor:
+            try:
+                direction, created_at, pk = decode_cursor(cursor)
+            except InvalidCursor as e:
+                logger.info(str(e))
+
+        queryset = self.queryset
+        if direction == PREV:
+            queryset = queryset.filter(
+                __raw__=self._range_query('$gt', created_at, pk)
+            ).order_by('created_at', 'id')
+        else:
+            if direction == NEXT:
+                queryset = queryset.filter(
+                    __raw__=self._range_query('$lt', created_at, pk)
+                )
+            queryset = queryset.order_by('-created_at', '-id')
+
+        items = list(queryset.limit(self.per_page + 1))
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+
+        if direction == PREV:
+            items.reverse()
+            return CursorPage(items, has_next=True, has_prev=has_more)
+
+        return CursorPage(items,
+                          has_next=has_more,
+                          has_prev=direction == NEXT)
+
+
+def paginate(queryset, cursor=None, per_page=None):
+    return CursorPaginator(queryset, per_page).page(cursor)
@@ -0,0 +1,14 @@
+# coding: utf-8
+"""
+Core background tasks, run by a celery worker when ASYNC_SAVE_MODE is on
+"""
+
+from quokka import create_celery_app
+
+celery = create_celery_app()
+
+
+@celery.task
+def run_channel_moves():
+    from quokka.core.models import ChannelMove
+    ChannelMove.run_pending()
@@ -1,16 +1,116 @@
 # -*- coding: utf-8 -*-
 
-from flask import session, current_app
+import os
+import time
+import logging
+from flask import session, current_app, template_rendered
+from flask import render_template as render_flask_template
 from quokka_themes import render_theme_template
+from quokka.utils.lru import LRUCache
 
+logger = logging.getLogger()
 
-def render_template(template, theme=None, **context):
+
+class TemplateResolver(object):
+    """Remembers which template (and theme) won the fallback chain for a
+    cache_key, so next renders skip the loader misses of the chain.
+
+    Entries are dropped when a template folder of the app, of a blueprint
+    or of a theme changes on disk (checked every `check_interval` secs)
+    """
+
+    def __init__(self, maxsize=2000, check_interval=10):
+        self.resolved = LRUCache(maxsize)
+        self.check_interval = check_interval
+        self._fingerprint = None
+        self._checked_at = 0
+
+    def template_folders(self, app):
+        folders = [os.path.join(app.root_path, app.template_folder)]
+        for blueprint in app.blueprints.values():
+            if blueprint.template_folder:
+                folders.append(os.path.join(blueprint.root_path,
+                                            blueprint.template_folder))
+        theme_manager = getattr(app, 'theme_manager', None)
+        if theme_manager:
+            folders.extend(theme.templates_path
+                           for theme in theme_manager.themes.values())
+        return folders
+
+    def fingerprint(self, app):
+        """mtimes of every template directory, files added, removed or
+        renamed change the mtime of its directory"""
+        mtimes = []
+        for folder in self.template_folders(app):
+            for path, dirs, files in os.walk(folder):
+                mtimes.append((path, os.stat(path).st_mtime))
+        return hash(tuple(mtimes))
+
+    def clear(self, *args, **kwargs):
+        """signal receiver, forget every resolved template"""
+        self.resolved.clear()
+
+    def check(self, app):
+        now = time.time()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        fingerprint = self.fingerprint(app)
+        if fingerprint != self._fingerprint:
+            if self._fingerprint is not None:
+                logger.info("Templates changed on disk, resolver cleared")
+            self.clear()
+            self._fingerprint = fingerprint
+
+    def render(self, key, template, theme, **context):
+        app = current_app._get_current_object()
+        self.check(app)
+
+        resolved = self.resolved.get(key)
+        if resolved:
+            name, active_theme = resolved
+            if active_theme:
+                context['_theme'] = active_theme
+            return render_flask_template(name, **context)
+
+        if callable(template):
+            template = template()
+
+        token = context['_resolver_token'] = object()
+
+        def record(sender, template, context, **extra):
+            if context.get('_resolver_token') is token:
+                self.resolved.set(key, (template.name, context.get('_theme')))
+
+        with template_rendered.connected_to(record, app):
+            return render_theme_template(theme, template, **context)
+
+
+template_resolver = TemplateResolver()
+
+
+def render_template(template, theme=None, cache_key=None, **context):
+    """render template (a name, a list of names or a callable returning
+    them) with the theme chain, the session theme is tried last.
+
+    when cache_key is given the template which wins the fallback chain is
+    remembered for the same cache_key and theme chain.
+    """
     theme = theme or []
     if not isinstance(theme, (list, tuple)):
         theme = [theme]
+    theme = list(theme)
 
     sys_theme = session.get('theme', current_app.config.get('DEFAULT_THEME'))
-    if sys_theme:
+    if sys_theme and sys_theme not in theme:
         theme.append(sys_theme)
 
+    if cache_key is not None:
+        return template_resolver.render(
+            (cache_key, tuple(theme)), template, theme, **context
+        )
+
+    if callable(template):
+        template = template()
+
     return render_theme_template(theme, template, **context)
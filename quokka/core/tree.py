@@ -0,0 +1,206 @@
+# coding: utf-8
+
+"""
+In-process materialized channel tree.
+
+Every Channel (and ChannelType) is loaded in a single query into an
+immutable snapshot which answers parent, children, ancestors and
+descendants lookups from dicts, so rendering menus or picking themes does
+not hit MongoDB.
+
+The tree is versioned, saving or deleting a Channel or a ChannelType bumps
+the version (see the signals connected in quokka.core.models) and the next
+access rebuilds the snapshot. The version is local to the worker, pages
+depending on the tree use the etag of the snapshot, a digest of what it
+loaded which is the same in every worker holding the same tree.
+
+    from quokka.core.tree import channel_tree
+    channel_tree.get_children(channel, show_in_menu=True)
+"""
+
+import hashlib
+import logging
+import threading
+from bson import DBRef, json_util
+
+logger = logging.getLogger()
+
+
+def ref_id(value):
+    """return the id of a raw reference value without dereferencing it"""
+    if value is None:
+        return None
+    if isinstance(value, DBRef):
+        return value.id
+    return getattr(value, 'pk', value)
+
+
+def match(channel, filters):
+    return all(getattr(channel, k, None) == v for k, v in filters.items())
+
+
+class ChannelTreeSnapshot(object):
+
+    def __init__(self, channels, channel_types, version):
+        self.version = version
+        self._etag = None
+        self.by_id = {}
+        self.by_long_slug = {}
+        self.by_mpath = {}
+        self.children = {}
+        self.homepage = None
+
+        self.types = types = {channel_type.pk: channel_type
+                              for channel_type in channel_types}
+
+        for channel in channels:
+            self.by_id[channel.pk] = channel
+            self.by_long_slug[channel.long_slug] = channel
+            self.by_mpath[channel.mpath] = channel
+            if channel.is_homepage:
+                self.homepage = channel
+
+        for channel in self.by_id.values():
+            # replace raw references by snapshot documents
+            # so templates reading channel.parent do not query
+            parent_id = ref_id(channel._data.get('parent'))
+            parent = self.by_id.get(parent_id)
+            if parent is channel:
+                parent, parent_id = None, None
+            channel._data['parent'] = parent
+            type_id = ref_id(channel._data.get('channel_type'))
+            channel._data['channel_type'] = types.get(type_id)
+            self.children.setdefault(parent_id, []).append(channel)
+
+        for children in self.children.values():
+            children.sort(key=lambda channel: channel.long_slug)
+
+        self.ancestors = {}
+        self.descendants = {}
+        for channel in self.by_id.values():
+            self.ancestors[channel.pk] = self._build_ancestors(channel)
+        for channel in self.by_id.values():
+            for ancestor in self.ancestors[channel.pk]:
+                self.descendants.setdefault(ancestor.pk, []).append(channel)
+        for descendants in self.descendants.values():
+            descendants.sort(key=lambda channel: channel.long_slug)
+
+    @property
+    def etag(self):
+        """digest of the channels and channel types of the snapshot"""
+        if self._etag is None:
+            digest = hashlib.sha1()
+            for documents in (self.by_id, self.types):
+                for pk in sorted(documents):
+                    digest.update(json_util.dumps(documents[pk].to_mongo()))
+            self._etag = digest.hexdigest()
+        return self._etag
+
+    def _build_ancestors(self, channel):
+        """ancestors including self as 1st item, ordered by depth"""
+        ancestors = []
+        slugs = channel.long_slug.split('/')
+        while slugs:
+            ancestor = self.by_long_slug.get("/".join(slugs))
+            if ancestor:
+                ancestors.append(ancestor)
+            slugs.pop()
+        return ancestors
+
+
+class ChannelTree(object):
+
+    def __init__(self):
+        self.version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def invalidate(self, *args, **kwargs):
+        """signal receiver, mark the current snapshot as stale"""
+        with self._lock:
+            self.version += 1
+
+    def build(self):
+        from quokka.core.models import Channel, ChannelType
+        version = self.version
+        snapshot = ChannelTreeSnapshot(Channel.objects.order_by('long_slug'),
+                                       ChannelType.objects,
+                                       version)
+        logger.debug("Channel tree version {0} built with {1} channels".format(
+            version, len(snapshot.by_id)))
+        return snapshot
+
+    @property
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != self.version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != self.version:
+                    snapshot = self._snapshot = self.build()
+        return snapshot
+
+    def _lookup(self, channel, index):
+        snapshot = self.snapshot
+        return index(snapshot).get(channel.pk, []) if channel else []
+
+    def get(self, pk):
+        return self.snapshot.by_id.get(pk)
+
+    def get_by_long_slug(self, long_slug):
+        return self.snapshot.by_long_slug.get(long_slug)
+
+    def get_by_mpath(self, mpath):
+        return self.snapshot.by_mpath.get(mpath)
+
+    @property
+    def homepage(self):
+        return self.snapshot.homepage
+
+    @property
+    def etag(self):
+        return self.snapshot.etag
+
+    def get_parent(self, channel):
+        channel = self.get(channel.pk)
+        return channel and channel._data['parent']
+
+    def get_roots(self, **filters):
+        return [channel for channel in self.snapshot.children.get(None, [])
+                if match(channel, filters)]
+
+    def get_children(self, channel, **filters):
+        """direct children 1 level depth ordered by long_slug"""
+        return [child for child in
+                self._lookup(channel, lambda s: s.children)
+                if match(child, filters)]
+
+    def get_ancestors(self, channel, **filters):
+        """all ancestors including self as 1st item"""
+        return [ancestor for ancestor in
+                self._lookup(channel, lambda s: s.ancestors)
+                if match(ancestor, filters)]
+
+    def get_descendants(self, channel, **filters):
+        """all descendants including self as 1st item"""
+        return [descendant for descendant in
+                self._lookup(channel, lambda s: s.descendants)
+                if match(descendant, filters)]
+
+    def get_themes(self, channel):
+        """theme names of the channel types of channel and its ancestors,
+        nearest first"""
+        from quokka.utils import dedupe
+        return dedupe(
+            ancestor.channel_type.theme_name
+            for ancestor in self.get_ancestors(channel)
+            if ancestor.channel_type
+        )
+
+    def get_all(self):
+        """every channel ordered by long_slug, parents first"""
+        return sorted(self.snapshot.by_id.values(),
+                      key=lambda channel: channel.long_slug)
+
+
+channel_tree = ChannelTree()
@@ -3,19 +3,30 @@
 import logging
 import collections
 from datetime import datetime
-from flask import request, redirect, url_for
+from flask import request, redirect, url_for, abort, current_app
 from flask.views import MethodView
 from flask.ext.mongoengine.wtf import model_form
-from quokka.core.models import Channel, Content, Comment
+from quokka.core.models import (Channel, Content, Comment,
+                                descendants_query)
 from quokka.core.templates import render_template
+from quokka.core.pagination import paginate
+from quokka.core.dereference import prefetch
+from quokka.core.cache import response_cache, channel_tag, content_tag
+from quokka.core.conditional import conditional, make_etag
+from quokka.core.config import config_registry
+from quokka.core.tree import channel_tree, ref_id
 
 logger = logging.getLogger()
 
 
-class ContentList(MethodView):
-    object_name = "content"
-    template_suffix = "list"
-    template_ext = "html"
+class ListTemplateMixin(object):
+    """template fallback chain of a channel listing,
+    needs self.channel"""
+
+    def get_template_cache_key(self):
+        return (self.object_name, self.template_suffix, self.template_ext,
+                ref_id(self.channel._data.get('channel_type')),
+                self.channel.long_slug)
 
     def get_template_names(self):
 
@@ -24,12 +35,11 @@ class ContentList(MethodView):
         else:
             type_suffix = 'default'
 
-        self.template_suffix = "{0}_{1}".format(type_suffix,
-                                                self.template_suffix)
+        suffix = "{0}_{1}".format(type_suffix, self.template_suffix)
 
         common_data = dict(
             object_name=self.object_name,
-            suffix=self.template_suffix,
+            suffix=suffix,
             ext=self.template_ext
         )
 
@@ -44,51 +54,18 @@ class ContentList(MethodView):
         names.append(u"{object_name}/{suffix}.{ext}".format(**common_data))
         return names
 
-    def get(self, long_slug):
-        now = datetime.now()
-        path = long_slug.split('/')
-        mpath = ",".join(path)
-        mpath = ",{0},".format(mpath)
-
-        channel = Channel.objects.get_or_404(mpath=mpath)
-
-        if channel.render_content:
-            return ContentDetail().get(
-                channel.render_content.content.long_slug, True)
-
-        self.channel = channel
 
-        base_filters = {}
+class DetailTemplateMixin(object):
+    """template fallback chain of a content detail page,
+    needs self.content"""
 
-        filters = {
-            'published': True,
-            'available_at__lte': now,
-            'show_on_channel': True
-        }
-
-        if not channel.is_homepage:
-            base_filters['__raw__'] = {
-                'mpath': {'$regex': "^{0}".format(mpath)}}
-
-        filters.update(channel.get_content_filters())
-        contents = Content.objects(**base_filters).filter(**filters)
-
-        themes = channel.get_themes()
-        return render_template(self.get_template_names(),
-                               theme=themes,
-                               contents=contents,
-                               channel=channel)
-
-
-class ContentDetail(MethodView):
-    object_name = "content"
-    template_suffix = "detail"
-    template_ext = "html"
-
-    form = model_form(
-        Comment,
-        exclude=['created_at', 'created_by', 'published']
-    )
+    def get_template_cache_key(self):
+        content = self.content
+        return (self.object_name, self.template_suffix, self.template_ext,
+                ref_id(content._data.get('template_type')),
+                content.module_name, content.model_name,
+                ref_id(content._data.get('channel')),
+                content.long_slug, content.slug)
 
     def get_template_names(self):
 
@@ -97,8 +74,7 @@ class ContentDetail(MethodView):
         else:
             type_suffix = 'default'
 
-        self.template_suffix = "{0}_{1}".format(type_suffix,
-                                                self.template_suffix)
+        suffix = "{0}_{1}".format(type_suffix, self.template_suffix)
 
         module_name = self.content.module_name
         model_name = self.content.model_name
@@ -107,7 +83,7 @@ class ContentDetail(MethodView):
             object_name=self.object_name,
             module_name=module_name,
             model_name=model_name,
-            suffix=self.template_suffix,
+            suffix=suffix,
             ext=self.template_ext
         )
 
@@ -158,11 +134,92 @@ class ContentDetail(MethodView):
 
         return names
 
+
+class ContentList(ListTemplateMixin, MethodView):
+    object_name = "content"
+    template_suffix = "list"
+    template_ext = "html"
+    decorators = [response_cache.cached]
+    # reference fields resolved in batch for the listed contents
+    prefetch_fields = ('channel', 'created_by', 'template_type')
+
+    def get(self, long_slug=None):
+        if long_slug is None:
+            # home route, resolved per request so a new homepage is
+            # served without restarting the app
+            long_slug = Channel.get_homepage('long_slug') or "home"
+
+        now = datetime.now()
+        path = long_slug.split('/')
+        mpath = ",".join(path)
+        mpath = ",{0},".format(mpath)
+
+        channel = channel_tree.get_by_mpath(mpath)
+        if channel is None:
+            abort(404)
+        response_cache.tag(channel_tag(channel.long_slug))
+
+        if channel.render_content:
+            return ContentDetail().get(
+                channel.render_content.content.long_slug, True)
+
+        self.channel = channel
+
+        base_filters = {}
+
+        filters = {
+            'published': True,
+            'available_at__lte': now,
+            'show_on_channel': True
+        }
+
+        if not channel.is_homepage:
+            base_filters['__raw__'] = descendants_query(mpath)
+
+        filters.update(channel.get_content_filters())
+        contents = paginate(
+            Content.objects(**base_filters).filter(**filters).exclude(
+                *Content.get_projection('list')),
+            cursor=request.args.get('cursor'),
+            per_page=channel.get_per_page()
+        )
+        prefetch(contents, *self.prefetch_fields)
+
+        # no Last-Modified, the page also depends on the channel tree
+        # and the configs which have no modification date
+        etag = make_etag(
+            channel.id, channel_tree.etag, config_registry.etag,
+            *[u"{0}:{1}".format(content.id, content.updated_at)
+              for content in contents]
+        )
+
+        themes = channel.get_themes()
+        return conditional(
+            etag, None,
+            lambda: render_template(self.get_template_names,
+                                    theme=themes,
+                                    cache_key=self.get_template_cache_key(),
+                                    contents=contents,
+                                    channel=channel)
+        )
+
+
+class ContentDetail(DetailTemplateMixin, MethodView):
+    object_name = "content"
+    template_suffix = "detail"
+    template_ext = "html"
+    decorators = [response_cache.cached]
+
+    form = model_form(
+        Comment,
+        exclude=['content', 'created_at', 'created_by', 'published']
+    )
+
     def get_context(self, long_slug, render_content=False):
         now = datetime.now()
-        homepage = Channel.objects.get(is_homepage=True)
+        homepage = Channel.get_homepage()
 
-        if long_slug.startswith(homepage.slug) and \
+        if homepage and long_slug.startswith(homepage.slug) and \
                 len(long_slug.split('/')) < 3 and \
                 not render_content:
             slug = long_slug.split('/')[-1]
@@ -179,6 +236,8 @@ class ContentDetail(MethodView):
                 **filters
             )
         except Content.DoesNotExist:
+            if homepage is None:
+                abort(404)
             content = Content.objects.get_or_404(
                 channel=homepage,
                 slug=long_slug,
@@ -188,9 +247,14 @@ class ContentDetail(MethodView):
         form = self.form(request.form)
 
         self.content = content
+        response_cache.tag(content_tag(content.id))
 
         context = {
             "content": content,
+            "comments": content.get_comments(
+                cursor=request.args.get('cursor'),
+                per_page=current_app.config.get('COMMENTS_PER_PAGE')
+            ),
             "form": form,
             "channel": content.channel
         }
@@ -201,10 +265,19 @@ class ContentDetail(MethodView):
         context = self.get_context(long_slug, render_content)
         if not render_content and isinstance(context, collections.Callable):
             return context
-        return render_template(
-            self.get_template_names(),
-            theme=self.content.get_themes(),
-            **context
+        content = self.content
+        comments = context['comments']
+        last_comment = comments[0].created_at if comments else None
+        return conditional(
+            make_etag(content.id, content.updated_at, content.comment_count,
+                      last_comment, channel_tree.etag, config_registry.etag),
+            None,
+            lambda: render_template(
+                self.get_template_names,
+                theme=content.get_themes(),
+                cache_key=self.get_template_cache_key(),
+                **context
+            )
         )
 
     def post(self, long_slug):
@@ -216,8 +289,7 @@ class ContentDetail(MethodView):
             form.populate_obj(comment)
 
             content = context.get('content')
-            content.comments.append(comment)
-            content.save()
+            content.add_comment(comment)
 
             return redirect(url_for('.detail', long_slug=long_slug))
 
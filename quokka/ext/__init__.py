@@ -5,7 +5,10 @@ from flask.ext.security import Security, MongoEngineUserDatastore
 
 from dealer.contrib.flask import Dealer
 from quokka.core.db import db
+from quokka.core.cache import response_cache
+from quokka.core.bus import invalidation_bus
 from quokka.core.admin import configure_admin
+from quokka.core.models import connect_content_signals
 from quokka.modules.accounts.models import Role, User
 
 from . import (generic, babel, blueprints, error_handlers, context_processors,
@@ -16,10 +19,12 @@ def configure_extensions(app, admin):
     babel.configure(app)
     generic.configure(app)
     Cache(app)
+    response_cache.init_app(app)
     Mail(app)
     Dealer(app)
     error_handlers.configure(app)
     db.init_app(app)
+    invalidation_bus.init_app(app)
     fixtures.configure(app, db)
     themes.configure(app, db)  # Themes should be configured after db
 
@@ -31,6 +36,7 @@ def configure_extensions(app, admin):
 
     blueprints.load_from_packages(app)
     blueprints.load_from_folder(app)
+    connect_content_signals()
 
     configure_admin(app, admin)
 
@@ -2,6 +2,7 @@
 
 import datetime
 from quokka.core.models import Channel, Config, Content
+from quokka.core.tree import channel_tree
 
 
 def configure(app):
@@ -10,9 +11,10 @@ def configure(app):
     def inject():
         now = datetime.datetime.now()
         return dict(
-            channels=Channel.objects(published=True,
-                                     available_at__lte=now,
-                                     parent=None),
+            channels=[channel for channel in
+                      channel_tree.get_roots(published=True)
+                      if channel.available_at and channel.available_at <= now],
+            channel_tree=channel_tree,
             Config=Config,
             Content=Content,
             Channel=Channel
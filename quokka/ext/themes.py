@@ -8,9 +8,7 @@ def configure(app, db=None):
     themes.init_themes(app, app_identifier="quokka")
 
     try:
-        from quokka.core.models import Config
-        s = Config.objects.get(group='settings')
-        settings = {i.name: i.value for i in s.values}
-        app.config.update(settings)
+        from quokka.core.config import config_registry
+        config_registry.sync_settings(app)
     except Exception as e:
         print(str(e))
@@ -4,7 +4,6 @@ import os
 from flask import send_from_directory, current_app, request
 from flask.ext.security import roles_accepted
 from quokka.core.views import ContentDetail, ContentList
-from quokka.core.models import Channel
 from quokka.modules.question.views import QuestionDetail
 
 
@@ -16,11 +15,13 @@ def template_files(filename):
 
 
 def media(filename):
-    return send_from_directory(current_app.config.get('MEDIA_ROOT'), filename)
+    return send_from_directory(current_app.config.get('MEDIA_ROOT'), filename,
+                               conditional=True)
 
 
 def static_from_root():
-    return send_from_directory(current_app.static_folder, request.path[1:])
+    return send_from_directory(current_app.static_folder, request.path[1:],
+                               conditional=True)
 
 
 def configure(app):
@@ -47,5 +48,5 @@ def configure(app):
     app.add_url_rule(
         '/',
         view_func=ContentList.as_view('home'),
-        defaults={"long_slug": Channel.get_homepage('long_slug') or "home"}
+        defaults={"long_slug": None}
     )
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from flask import request
 from flask.views import MethodView
 from quokka.core.templates import render_template
+from quokka.core.pagination import paginate
 
 from .models import Media
 
@@ -14,7 +16,8 @@ class ListView(MethodView):
 
     def get(self):
         logger.info('getting list of media')
-        medias = Media.objects.all()
+        medias = paginate(Media.objects.all(),
+                          cursor=request.args.get('cursor'))
         return render_template('media/list.html', medias=medias)
 
 
@@ -26,6 +26,7 @@ class PostAdmin(ModelAdmin):
 
     column_list = ('title', 'slug', 'channel', 'published', 'created_at',
                    'available_at', 'view_on_site')
+    column_prefetch = ('channel',)
 
     def view_on_site(self, request, obj, fieldname, *args, **kwargs):
         return html.a(
@@ -52,7 +53,7 @@ class PostAdmin(ModelAdmin):
     form_columns = ['title', 'slug', 'channel', 'related_channels', 'summary',
                     'body', 'published', 'contents',
                     'show_on_channel', 'available_at', 'available_until',
-                    'tags', 'comments', 'values', 'template_type']
+                    'tags', 'values', 'template_type']
     # form_excluded_columns = []
     # form = None
     # form_overrides = None
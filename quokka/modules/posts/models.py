@@ -8,3 +8,9 @@ from quokka.core.models import Content
 class Post(Content):
     # URL_NAMESPACE = 'posts.detail'
     body = db.StringField(required=True)
+
+    projections = dict(
+        Content.projections,
+        list=Content.projections['list'] + ('body',),
+        sitemap=Content.projections['sitemap'] + ('body',)
+    )
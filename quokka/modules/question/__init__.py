@@ -1,3 +1,9 @@
 from quokka.core.app import QuokkaModule
+from .views import QuestionStats, ChannelQuestionStats
 
-module = QuokkaModule('questions', __name__, template_folder='templates')
\ No newline at end of file
+module = QuokkaModule('questions', __name__, template_folder='templates')
+
+module.add_url_rule('/questions/<pretty_slug>/stats.json',
+                    view_func=QuestionStats.as_view('stats'))
+module.add_url_rule('/questions/stats/<path:long_slug>.json',
+                    view_func=ChannelQuestionStats.as_view('channel_stats'))
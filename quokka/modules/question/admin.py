@@ -1,14 +1,23 @@
+from flask import request, flash
 from flask.ext.babel import lazy_gettext
 from flask.ext.htmlbuilder import html
+from flask.ext.admin import expose
 from quokka import admin
 from quokka.core.admin import _l, _, ModelAdmin
 from quokka.modules.posts.admin import PostAdmin
 from quokka.modules.question.models import Question
+from quokka.modules.question.importer import QuestionImporter, read
+from quokka.utils import get_current_user
+
+
+def format_correct_rate(self, request, obj, fieldname, *args, **kwargs):
+    rate = obj.correct_rate
+    return '-' if rate is None else "{0:.0%}".format(rate)
 
 
 class QuestionAdmin(PostAdmin):
     column_list = ('title', 'slug', 'pretty_slug', 'channel', 'published', 'created_at',
-                   'view_on_site')
+                   'answer_count', 'correct_rate', 'view_on_site')
 
     #form_columns = ['title', 'slug', 'channel', 'related_channels', 'summary',
     #                'body', 'choice_A', 'choice_B', 'choice_C', 'choice_D', 'published', 'contents',
@@ -22,7 +31,29 @@ class QuestionAdmin(PostAdmin):
         )(html.i(class_="icon icon-eye-open", style="margin-right: 5px;")(),
           lazy_gettext('View on site'))
 
+    list_template = 'admin/question/list.html'
+
+    @expose('/import/', methods=('GET', 'POST'))
+    def import_view(self):
+        result = None
+        upload = request.files.get('file')
+        if request.method == 'POST' and upload:
+            importer = QuestionImporter(
+                user=get_current_user(reference=True),
+                published=bool(request.form.get('published'))
+            )
+            try:
+                result = importer.run(read(upload.stream, upload.filename,
+                                           request.form.get('format')))
+            except ValueError as e:
+                flash(u"{0}".format(e), 'error')
+            else:
+                flash(_("%(count)s questions imported",
+                        count=result.inserted))
+        return self.render('admin/question/import.html', result=result)
+
     column_formatters = {'view_on_site': view_on_site,
+                         'correct_rate': format_correct_rate,
                          'created_at': ModelAdmin.formatters.get('datetime'),
                          'available_at': ModelAdmin.formatters.get('datetime')}
 
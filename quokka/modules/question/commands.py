@@ -0,0 +1,104 @@
+# coding: utf-8
+
+from flask.ext.script import Command, Option
+from quokka.modules.accounts.models import User
+from .models import Question, Answer, CHOICES, next_pretty_slug
+from .stats import backfill
+from .importer import QuestionImporter, read
+
+
+class MigrateAnswers(Command):
+    "Move the tries embedded in questions to the answer collection"
+
+    command_name = 'migrate_answers'
+
+    def run(self):
+        questions = Question._get_collection()
+        answers = Answer._get_collection()
+        migrated = 0
+        for doc in questions.find({'tries': {'$exists': True}},
+                                  {'tries': True}):
+            tries = doc.get('tries') or []
+            tallies = dict((choice, 0) for choice in CHOICES)
+            for answer in tries:
+                answer.pop('_cls', None)
+                answer['question'] = doc['_id']
+                if answer.get('answer') in tallies:
+                    tallies[answer['answer']] += 1
+            if tries:
+                answers.insert(tries)
+            increments = dict(('tallies.{0}'.format(choice), count)
+                              for choice, count in tallies.items())
+            increments['answer_count'] = len(tries)
+            questions.update({'_id': doc['_id']},
+                             {'$unset': {'tries': True},
+                              '$inc': increments})
+            migrated += len(tries)
+        Answer.ensure_indexes()
+        print("{0} answers migrated".format(migrated))
+
+
+class BackfillAnswerStats(Command):
+    "Rebuild question and channel answer counters from the answers"
+
+    command_name = 'backfill_answer_stats'
+
+    def run(self):
+        questions, channels = backfill()
+        print("Answer stats of {0} questions and {1} channels rebuilt"
+              .format(questions, channels))
+
+
+class FixPrettySlugs(Command):
+    "Give a new pretty_slug to questions sharing one, then index it"
+
+    command_name = 'fix_pretty_slugs'
+
+    def run(self):
+        pipeline = [
+            {'$match': {'pretty_slug': {'$exists': True}}},
+            {'$group': {'_id': '$pretty_slug',
+                        'ids': {'$push': '$_id'},
+                        'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}}
+        ]
+        collection = Question._get_collection()
+        fixed = 0
+        for row in collection.aggregate(pipeline, cursor={}):
+            # the oldest question keeps the slug
+            for pk in sorted(row['ids'])[1:]:
+                pretty_slug = next_pretty_slug()
+                collection.update({'_id': pk},
+                                  {'$set': {'pretty_slug': pretty_slug}})
+                fixed += 1
+        Question.ensure_indexes()
+        print("{0} pretty slugs changed".format(fixed))
+
+
+class ImportQuestions(Command):
+    "Import questions from a csv, json or markdown file"
+
+    command_name = 'import_questions'
+
+    option_list = (
+        Option('--file', '-f', dest='filename', required=True),
+        Option('--format', dest='format'),
+        Option('--batch-size', '-b', dest='batch_size', type=int,
+               default=1000),
+        Option('--user', '-u', dest='email'),
+        Option('--unpublished', dest='published', action='store_false',
+               default=True),
+    )
+
+    def run(self, filename, format=None, batch_size=1000, email=None,
+            published=True):
+        user = User.objects.get(email=email) if email else None
+        importer = QuestionImporter(batch_size=batch_size, user=user,
+                                    published=published)
+        with open(filename, 'rb') as stream:
+            result = importer.run(read(stream, filename, format))
+
+        for number, message in result.errors:
+            print(u"row {0}: {1}".format(number, message))
+        print("{0} questions imported, {1} rows failed".format(
+            result.inserted, len(result.errors)))
@@ -0,0 +1,271 @@
+# coding: utf-8
+
+"""
+Bulk question import.
+
+Rows are read as a stream from csv, json (an array or one object per line)
+or markdown files and imported in batches, every batch is saved by
+Question.bulk_save with a single slug lookup and a single bulk write. Rows
+which fail to parse or to validate are reported with their number and do
+not stop the import, except inside a json array whose next row can not be
+found after a malformed one::
+
+    importer = QuestionImporter(user=user)
+    result = importer.run(read(open('bank.csv'), 'bank.csv'))
+    print(result.inserted, result.errors)
+
+csv and json rows use the field names of Question plus `channel` (the
+channel long_slug). The markdown format is one question per `#` title::
+
+    # What is 2 + 2?
+    channel: math/basics
+    answer: B
+
+    Pick the right one.
+
+    A) 3
+    B) 4
+    C) 5
+    D) 22
+    E) none
+"""
+
+import re
+import csv
+import json
+import logging
+import datetime
+from mongoengine.errors import ValidationError
+from quokka.core.tree import channel_tree
+from quokka.utils import batches
+from .models import Question, CHOICES
+
+logger = logging.getLogger()
+
+FIELDS = ('title', 'slug', 'channel', 'summary', 'body',
+          'choice_A', 'choice_B', 'choice_C', 'choice_D', 'choice_E',
+          'correct_answer', 'published', 'tags')
+
+TRUE = ('1', 'true', 'yes', 'y', 'on')
+
+
+def decode(value):
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return value
+
+
+class RowError(object):
+    """a row which could not be parsed, recorded as an import error"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield RowError(e)
+            continue
+        yield dict((decode(key), decode(value))
+                   for key, value in row.items() if key)
+
+
+def json_row(row):
+    if not isinstance(row, dict):
+        return RowError("Not a json object: {0}".format(row))
+    return row
+
+
+def read_json_lines(lines):
+    for line in lines:
+        if line.strip():
+            try:
+                yield json_row(json.loads(line))
+            except ValueError as e:
+                yield RowError(e)
+
+
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_json_array(stream, chunk_size=64 * 1024, max_row_size=1024 * 1024):
+    """rows of a json array whose [ was read, decoded one by one from
+    chunks of the stream so the array is never held in memory"""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            if position == len(buffer):
+                raise ValueError("Unterminated json array")
+            row, position = decoder.raw_decode(buffer, position)
+        except ValueError as e:
+            if eof or len(buffer) - position > max_row_size:
+                yield RowError(e)
+                return
+            # the row is incomplete, read more of it
+            chunk = stream.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        yield json_row(row)
+
+
+def read_json(stream):
+    """a json array or one json object per line"""
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if first == '[':
+        for row in read_json_array(stream):
+            yield row
+        return
+    if first:
+        for row in read_json_lines([first + stream.readline()]):
+            yield row
+    for row in read_json_lines(iter(stream.readline, '')):
+        yield row
+
+
+MARKDOWN_TITLE = re.compile(r'^#\s+(.*)$')
+MARKDOWN_META = re.compile(r'^(\w+)\s*:\s*(.*)$')
+MARKDOWN_CHOICE = re.compile(r'^([A-E])[).]\s+(.*)$')
+
+
+def read_markdown(stream):
+    row = None
+    for line in stream:
+        line = decode(line).rstrip('\r\n')
+        title = MARKDOWN_TITLE.match(line)
+        if title:
+            if row is not None:
+                yield finish_markdown(row)
+            row = {'title': title.group(1).strip(), 'body': [],
+                   'in_meta': True}
+            continue
+        if row is None:
+            continue
+        meta = MARKDOWN_META.match(line)
+        if row['in_meta'] and meta:
+            key = meta.group(1).lower()
+            row['correct_answer' if key == 'answer' else key] = \
+                meta.group(2).strip()
+            continue
+        row['in_meta'] = False
+        choice = MARKDOWN_CHOICE.match(line)
+        if choice:
+            row['choice_' + choice.group(1)] = choice.group(2).strip()
+        else:
+            row['body'].append(line)
+    if row is not None:
+        yield finish_markdown(row)
+
+
+def finish_markdown(row):
+    row.pop('in_meta')
+    row['body'] = u"\n".join(row['body']).strip()
+    return row
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_json,
+    'md': read_markdown,
+    'markdown': read_markdown
+}
+
+
+def read(stream, filename=None, format=None):
+    """rows of stream, format defaults to the filename extension"""
+    format = (format or (filename or '').rsplit('.', 1)[-1]).lower()
+    if format not in READERS:
+        raise ValueError("Unknown import format {0}".format(format))
+    return READERS[format](stream)
+
+
+class ImportResult(object):
+
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def error(self, number, message):
+        self.errors.append((number, u"{0}".format(message)))
+
+    def __repr__(self):
+        return "<ImportResult inserted={0} errors={1}>".format(
+            self.inserted, len(self.errors))
+
+
+class QuestionImporter(object):
+
+    def __init__(self, batch_size=1000, user=None, published=True):
+        self.batch_size = batch_size
+        self.user = user
+        self.published = published
+
+    def run(self, rows):
+        result = ImportResult()
+        for batch in batches(enumerate(rows, 1), self.batch_size):
+            self.import_batch(batch, result)
+        result.errors.sort()
+        logger.info("Question import: {0}".format(result))
+        return result
+
+    def get_channel(self, long_slug):
+        channel = channel_tree.get_by_long_slug((long_slug or '').strip('/'))
+        if channel is None:
+            raise ValueError("Channel {0} does not exist".format(long_slug))
+        return channel
+
+    def build(self, row, now):
+        row = dict((key, row.get(key)) for key in FIELDS
+                   if row.get(key) not in (None, ''))
+        published = row.pop('published', self.published)
+        if not isinstance(published, bool):
+            published = decode(published).lower() in TRUE
+        tags = row.pop('tags', [])
+        if not isinstance(tags, list):
+            tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+        answer = row.pop('correct_answer', '').strip().upper()
+        if answer not in CHOICES:
+            raise ValueError("Invalid correct_answer {0}".format(answer))
+
+        return Question(
+            channel=self.get_channel(row.pop('channel', None)),
+            correct_answer=answer,
+            published=published,
+            tags=tags,
+            created_at=now,
+            available_at=now,
+            **row
+        )
+
+    def import_batch(self, batch, result):
+        now = datetime.datetime.now()
+        numbers = {}
+        questions = []
+        for number, row in batch:
+            if isinstance(row, RowError):
+                result.error(number, row.message)
+                continue
+            try:
+                question = self.build(row, now)
+            except (ValueError, TypeError, ValidationError) as e:
+                result.error(number, e)
+            else:
+                numbers[id(question)] = number
+                questions.append(question)
+
+        errors = Question.bulk_save(questions, user=self.user)
+        for question, error in errors:
+            result.error(numbers[id(question)], error)
+        result.inserted += len(questions) - len(errors)
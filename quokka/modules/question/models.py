@@ -1,15 +1,23 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import datetime
-import random
 from flask import url_for
+from mongoengine import signals
 
 from quokka.core.db import db
-from quokka.core.models import Content, LongSlugged
+from quokka.core.models import Channel, Content, LongSlugged
+from quokka.core.pagination import paginate
+from quokka.core.tree import ref_id
 from quokka.modules.accounts.models import User
 
-class Answer(db.EmbeddedDocument):
-    answer = db.StringField(verbose_name="Answer", required=True)
+CHOICES = [chr(65 + k) for k in range(0, 5)]
+
+
+class Answer(db.Document):
+    """one submitted try, answers are only inserted, never rewritten"""
+    question = db.ReferenceField('Question', required=True)
+    answer = db.StringField(verbose_name="Answer", required=True,
+                            choices=CHOICES)
     explanation = db.StringField(verbose_name="Explanation", required=False)
     #author = db.StringField(verbose_name="Name", max_length=255, required=True)
     published = db.BooleanField(default=False)
@@ -17,21 +25,169 @@ class Answer(db.EmbeddedDocument):
     created_by = db.ReferenceField(User)
 
     def __unicode__(self):
-        return "{0}-{1}...".format(self.author, self.body[:10])
+        return "{0}-{1}".format(self.created_by, self.answer)
 
     meta = {
-        'indexes': ['-created_at', '-available_at'],
+        'indexes': [('question', '-created_at', '-id'),
+                    ('created_by', 'question', '-created_at')],
         'ordering': ['-created_at']
     }
 
 
+class AnswerCounters(object):
+    """attempts, per choice distribution and correct answers"""
+    answer_count = db.IntField(default=0)
+    correct_count = db.IntField(default=0)
+    tallies = db.DictField()
+
+    @property
+    def correct_rate(self):
+        if not self.answer_count:
+            return None
+        return float(self.correct_count) / self.answer_count
+
+    def get_tallies(self):
+        return dict((choice, self.tallies.get(choice, 0))
+                    for choice in CHOICES)
+
+    def get_stats(self):
+        return {'answer_count': self.answer_count,
+                'correct_count': self.correct_count,
+                'correct_rate': self.correct_rate,
+                'tallies': self.get_tallies()}
+
+
+class ChannelAnswerStats(AnswerCounters, db.Document):
+    """answer counters of all questions of a channel,
+    descendants not included"""
+    channel = db.ReferenceField(Channel, required=True, unique=True,
+                                reverse_delete_rule=db.CASCADE)
+
+    def __unicode__(self):
+        return u"{0}".format(self.channel)
+
+
+def count_answer(sender, document, created=None, **kwargs):
+    """update the question and channel counters as answers arrive,
+    created is None on delete"""
+    if created is False:
+        return
+    step = 1 if created else -1
+    question = document.question
+    if question is None:
+        return
+    increments = {
+        'inc__answer_count': step,
+        'inc__tallies__{0}'.format(document.answer): step
+    }
+    if document.answer == question.correct_answer:
+        increments['inc__correct_count'] = step
+
+    Question.objects(pk=question.pk).update_one(**increments)
+    ChannelAnswerStats.objects(
+        channel=ref_id(question._data.get('channel'))
+    ).update_one(upsert=True, **increments)
+
+
+signals.post_save.connect(count_answer, sender=Answer)
+signals.post_delete.connect(count_answer, sender=Answer)
+
+
+def counter_increments(step, answer_count, correct_count, tallies):
+    values = {'inc__answer_count': step * answer_count,
+              'inc__correct_count': step * correct_count}
+    for choice, count in tallies.items():
+        values['inc__tallies__{0}'.format(choice)] = step * count
+    return values
+
+
+def move_answer_counters(old, question):
+    """the question changed channel or correct_answer after answers were
+    counted, move its counters to the new channel and recount the correct
+    answers. old is the raw question before the change, Question.bulk_move
+    moves the counters of many questions at once"""
+    tallies = old.get('tallies') or {}
+    old_correct = tallies.get(old.get('correct_answer'), 0)
+    new_correct = tallies.get(question.correct_answer, 0)
+    Question.objects(pk=question.pk).update_one(
+        inc__correct_count=new_correct - old.get('correct_count', 0))
+    if not old.get('answer_count'):
+        return
+
+    old_channel = old.get('channel')
+    new_channel = ref_id(question._data.get('channel'))
+    if old_channel == new_channel:
+        if new_correct != old_correct:
+            ChannelAnswerStats.objects(channel=new_channel).update_one(
+                upsert=True, inc__correct_count=new_correct - old_correct)
+        return
+
+    ChannelAnswerStats.objects(channel=old_channel).update_one(
+        **counter_increments(-1, old['answer_count'], old_correct, tallies))
+    ChannelAnswerStats.objects(channel=new_channel).update_one(
+        upsert=True,
+        **counter_increments(1, old['answer_count'], new_correct, tallies))
+
+
+class Answerable(AnswerCounters):
+    """tries live in the answer collection, the question only stores
+    the counters"""
+
+    def get_answers(self, cursor=None, per_page=None, **filters):
+        return paginate(Answer.objects(question=self, **filters),
+                        cursor=cursor, per_page=per_page)
 
-class Answerable(object):
-    tries = db.ListField(db.EmbeddedDocumentField(Answer), default=[])
+    def add_answer(self, answer, user=None):
+        answer.question = self
+        answer.created_by = user
+        answer.save()
+        self.answer_count += 1
+        self.tallies[answer.answer] = self.tallies.get(answer.answer, 0) + 1
+        if answer.answer == self.correct_answer:
+            self.correct_count += 1
+        return answer
 
 
+BASE36 = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def base36(number):
+    digits = []
+    while True:
+        number, remainder = divmod(number, 36)
+        digits.append(BASE36[remainder])
+        if not number:
+            return ''.join(reversed(digits))
+
+
+def reserve_pretty_slugs(count):
+    """count short ids from an atomic counter, never reused"""
+    if not count:
+        return []
+    counter = Content._get_db()['counters'].find_and_modify(
+        {'_id': 'question.pretty_slug'},
+        {'$inc': {'next': count}},
+        upsert=True,
+        new=True
+    )
+    last = counter['next']
+    return ['q-' + base36(number)
+            for number in range(last - count + 1, last + 1)]
+
+
+def next_pretty_slug():
+    """next short id, q- and the counter in base 36 (q-1, ..., q-z, q-10)"""
+    return reserve_pretty_slugs(1)[0]
+
+
+def strip_outer_p(s):
+    if s and s.startswith("<p>") and s.endswith("</p>"):
+        return s[3:len(s)-4]
+    return s
+
 
 class QuestionLongSlugged(LongSlugged):
+    # assigned once, urls of a question do not change when it is edited
     pretty_slug = db.StringField(required=True)
 
     def _create_mpath_long_slug(self):
@@ -41,7 +197,8 @@ class QuestionLongSlugged(LongSlugged):
             )
             self.mpath = "".join([self.channel.mpath, self.slug, ','])
 
-            self.pretty_slug = 'q-' + str(random.randint(1000000, 9999999))
+            if not self.pretty_slug:
+                self.pretty_slug = next_pretty_slug()
 
 
 class Question(Content, QuestionLongSlugged, Answerable):
@@ -52,10 +209,25 @@ class Question(Content, QuestionLongSlugged, Answerable):
     choice_C = db.StringField(required=True)
     choice_D = db.StringField(required=True)
     choice_E = db.StringField(required=True)
-    correct_answer = db.StringField(choices=[chr(65+k) for k in range(0, 5)], required=True)
+    correct_answer = db.StringField(choices=CHOICES, required=True)
 
     published = db.BooleanField(default=True)
 
+    meta = {
+        # sparse, other contents of the collection have no pretty_slug
+        'indexes': [
+            {'fields': ['pretty_slug'], 'unique': True, 'sparse': True}
+        ]
+    }
+
+    projections = dict(
+        Content.projections,
+        list=Content.projections['list'] + (
+            'body', 'choice_A', 'choice_B', 'choice_C', 'choice_D',
+            'choice_E'),
+        sitemap=Content.projections['sitemap'] + ('body',)
+    )
+
     def get_absolute_url(self, endpoint='question-detail'):
         if self.channel.is_homepage:
             #long_slug = self.slug
@@ -69,27 +241,88 @@ class Question(Content, QuestionLongSlugged, Answerable):
         except:
             return url_for(endpoint, pretty_slug=pretty_slug)
 
+    HTML_FIELDS = ('body', 'choice_A', 'choice_B', 'choice_C', 'choice_D',
+                   'choice_E')
+
+    def strip_html_fields(self):
+        for name in self.HTML_FIELDS:
+            setattr(self, name, strip_outer_p(getattr(self, name)))
+
     def save(self, *args, **kwargs):
+        self.strip_html_fields()
+        old = None
+        if self.pk and set(self._get_changed_fields()) & set(
+                ['channel', 'correct_answer']):
+            old = Question._get_collection().find_one(
+                {'_id': self.pk},
+                ['channel', 'correct_answer', 'answer_count',
+                 'correct_count', 'tallies'])
+        super(Question, self).save(*args, **kwargs)
+        if old is not None:
+            move_answer_counters(old, self)
 
-        def strip_outer_p(s):
-            if s.startswith("<p>") and s.endswith("</p>"):
-                res = s[3:len(s)-4]
-            else:
-                res = s
-            return res
+    def prepare_bulk_save(self, user, now):
+        self.strip_html_fields()
+        super(Question, self).prepare_bulk_save(user, now)
 
-        self.body = strip_outer_p(self.body)
-        self.choice_A = strip_outer_p(self.choice_A)
-        self.choice_B = strip_outer_p(self.choice_B)
-        self.choice_C = strip_outer_p(self.choice_C)
-        self.choice_D = strip_outer_p(self.choice_D)
-        self.choice_E = strip_outer_p(self.choice_E)
+    @classmethod
+    def bulk_save(cls, documents, user=None):
+        """as Content.bulk_save, pretty slugs are reserved at once"""
+        documents = list(documents)
+        missing = [document for document in documents
+                   if isinstance(document, Question) and
+                   not document.pretty_slug]
+        for document, pretty_slug in zip(
+                missing, reserve_pretty_slugs(len(missing))):
+            document.pretty_slug = pretty_slug
+        return super(Question, cls).bulk_save(documents, user=user)
 
-        super(Question, self).save(*args, **kwargs)
+    @classmethod
+    def bulk_move(cls, query, channel, user=None, batch_size=1000):
+        """as Content.bulk_move, the answer counters of the moved questions
+        are moved from the stats of their channels to the stats of channel
+        """
+        # as_pymongo drops the keys of a dict field loaded with only()
+        rows = list(query.only(
+            'slug', 'channel', 'answer_count', 'correct_count',
+            *['tallies.{0}'.format(choice) for choice in CHOICES]
+        ).as_pymongo())
+        moved, skipped = super(Question, cls).bulk_move(
+            query, channel, user=user, batch_size=batch_size)
+
+        not_moved = set(skipped)
+        totals = {}
+        for row in rows:
+            if not row.get('answer_count') or \
+                    row.get('channel') == channel.pk or \
+                    "/".join([channel.long_slug, row['slug']]) in not_moved:
+                continue
+            total = totals.setdefault(row.get('channel'), [0, 0, {}])
+            total[0] += row['answer_count']
+            total[1] += row.get('correct_count', 0)
+            for choice, count in (row.get('tallies') or {}).items():
+                total[2][choice] = total[2].get(choice, 0) + count
+
+        moved_total = [0, 0, {}]
+        for old_channel, (answers, correct, tallies) in totals.items():
+            ChannelAnswerStats.objects(channel=old_channel).update_one(
+                **counter_increments(-1, answers, correct, tallies))
+            moved_total[0] += answers
+            moved_total[1] += correct
+            for choice, count in tallies.items():
+                moved_total[2][choice] = \
+                    moved_total[2].get(choice, 0) + count
+        if totals:
+            ChannelAnswerStats.objects(channel=channel.pk).update_one(
+                upsert=True, **counter_increments(1, *moved_total))
+        return moved, skipped
+
+
+Question.register_delete_rule(Answer, 'question', db.CASCADE)
 
 
 class Candidate(User):
-    answers = db.ListField(
-        db.EmbeddedDocumentField(Answer), default=[]
-    )
 
+    @property
+    def answers(self):
+        return Answer.objects(created_by=self)
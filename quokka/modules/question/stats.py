@@ -0,0 +1,101 @@
+# coding: utf-8
+
+"""
+Answer statistics.
+
+Counters are kept up to date as answers arrive (see count_answer in
+models) and follow a question saved with another channel or correct
+answer (see move_answer_counters), this module reads them and rebuilds
+them from the answer collection with an aggregation pipeline.
+"""
+
+import logging
+from quokka.core.tree import channel_tree
+from .models import Question, Answer, ChannelAnswerStats, CHOICES
+
+logger = logging.getLogger()
+
+
+def empty_counters():
+    return {'answer_count': 0,
+            'correct_count': 0,
+            'tallies': dict((choice, 0) for choice in CHOICES)}
+
+
+def merge(counters, other):
+    counters['answer_count'] += other['answer_count']
+    counters['correct_count'] += other['correct_count']
+    for choice, count in other['tallies'].items():
+        counters['tallies'][choice] = \
+            counters['tallies'].get(choice, 0) + count
+    return counters
+
+
+def with_rate(counters):
+    total = counters['answer_count']
+    counters['correct_rate'] = (
+        float(counters['correct_count']) / total if total else None)
+    return counters
+
+
+def channel_stats(channel, descendants=True):
+    """counters of the questions in channel and, by default,
+    in all of its descendants"""
+    channels = [channel]
+    if descendants:
+        channels = channel_tree.get_descendants(channel) or channels
+    counters = empty_counters()
+    for stats in ChannelAnswerStats.objects(
+            channel__in=[item.pk for item in channels]):
+        merge(counters, stats.get_stats())
+    return with_rate(counters)
+
+
+def backfill():
+    """recompute every question and channel counter from the answers.
+
+    counters are replaced with $set, answers arriving while it runs may be
+    counted twice or missed, run it again once they stop to be exact"""
+    pipeline = [
+        {'$group': {'_id': {'question': '$question', 'answer': '$answer'},
+                    'count': {'$sum': 1}}}
+    ]
+    tallies = {}
+    for row in Answer._get_collection().aggregate(pipeline, cursor={}):
+        question_tallies = tallies.setdefault(row['_id']['question'], {})
+        question_tallies[row['_id']['answer']] = row['count']
+
+    questions = Question._get_collection()
+    by_channel = {}
+    bulk = questions.initialize_unordered_bulk_op()
+    count = 0
+    for doc in Question.objects.only('id', 'channel', 'correct_answer') \
+            .as_pymongo().no_cache():
+        question_tallies = tallies.get(doc['_id'], {})
+        counters = {
+            'answer_count': sum(question_tallies.values()),
+            'correct_count': question_tallies.get(doc.get('correct_answer'),
+                                                  0),
+            'tallies': question_tallies
+        }
+        bulk.find({'_id': doc['_id']}).update_one({'$set': counters})
+        merge(by_channel.setdefault(doc.get('channel'), empty_counters()),
+              counters)
+        count += 1
+    if count:
+        bulk.execute()
+
+    # set in place, deleting them would drop the answers counted meanwhile
+    by_channel.pop(None, None)
+    ChannelAnswerStats.objects(channel__nin=list(by_channel)).delete()
+    bulk = ChannelAnswerStats._get_collection() \
+        .initialize_unordered_bulk_op()
+    for channel, counters in by_channel.items():
+        bulk.find({'channel': channel}).upsert().update_one(
+            {'$set': counters})
+    if by_channel:
+        bulk.execute()
+
+    logger.info("Answer stats of {0} questions and {1} channels rebuilt"
+                .format(count, len(by_channel)))
+    return count, len(by_channel)
@@ -4,49 +4,31 @@ import logging
 import collections
 from datetime import datetime
 import random
-from flask import request, redirect, url_for, session
+from flask import request, redirect, url_for, session, abort, jsonify
 from flask.views import MethodView
 from flask.ext.mongoengine.wtf import model_form
+from flask.ext.security import roles_accepted
 from wtforms import RadioField, TextField
-from quokka.core.models import Channel, Content, Comment
+from quokka.core.models import (Channel, Content, Comment,
+                                descendants_query)
 from quokka.core.templates import render_template
+from quokka.core.pagination import paginate
+from quokka.core.dereference import prefetch
+from quokka.core.tree import channel_tree
+from quokka.core.views import ListTemplateMixin, DetailTemplateMixin
 from quokka.modules.question.models import Question, Answer
+from quokka.modules.question.stats import channel_stats
+from quokka.utils import get_current_user
+from quokka.utils.lru import LRUCache
 
 logger = logging.getLogger()
 
 
-class QuestionList(MethodView):
+class QuestionList(ListTemplateMixin, MethodView):
     object_name = "question"
     template_suffix = "list"
     template_ext = "html"
-
-    def get_template_names(self):
-
-        if self.channel.channel_type:
-            type_suffix = self.channel.channel_type.template_suffix
-        else:
-            type_suffix = 'default'
-
-        self.template_suffix = "{0}_{1}".format(type_suffix,
-                                                self.template_suffix)
-
-        common_data = dict(
-            object_name=self.object_name,
-            suffix=self.template_suffix,
-            ext=self.template_ext
-        )
-
-        channel_list = self.channel.get_ancestors_slugs()
-        names = [
-            u"{object_name}/{channel}/{suffix}.{ext}".format(
-                channel=channel, **common_data
-            )
-            for channel in channel_list
-        ]
-
-        names.append(u"{object_name}/{suffix}.{ext}".format(**common_data))
-
-        return names
+    prefetch_fields = ('channel', 'created_by', 'template_type')
 
     def get(self, pretty_slug):
         now = datetime.now()
@@ -54,7 +36,9 @@ class QuestionList(MethodView):
         mpath = ",".join(path)
         mpath = ",{0},".format(mpath)
 
-        channel = Channel.objects.get_or_404(mpath=mpath)
+        channel = channel_tree.get_by_mpath(mpath)
+        if channel is None:
+            abort(404)
 
         if channel.render_content:
             return QuestionDetail().get(
@@ -71,101 +55,42 @@ class QuestionList(MethodView):
         }
 
         if not channel.is_homepage:
-            base_filters['__raw__'] = {
-                'mpath': {'$regex': "^{0}".format(mpath)}}
+            base_filters['__raw__'] = descendants_query(mpath)
 
         filters.update(channel.get_content_filters())
-        contents = Content.objects(**base_filters).filter(**filters)
+        contents = paginate(
+            Content.objects(**base_filters).filter(**filters).exclude(
+                *Content.get_projection('list')),
+            cursor=request.args.get('cursor'),
+            per_page=channel.get_per_page()
+        )
+        prefetch(contents, *self.prefetch_fields)
 
         themes = channel.get_themes()
-        return render_template(self.get_template_names(),
-                               theme=themes, contents=contents)
+        return render_template(self.get_template_names,
+                               theme=themes,
+                               cache_key=self.get_template_cache_key(),
+                               contents=contents)
 
 
-class QuestionDetail(MethodView):
+class QuestionDetail(DetailTemplateMixin, MethodView):
     object_name = "question"
     template_suffix = "detail"
     template_ext = "html"
 
     Form = model_form(
         Answer,
-        exclude=['answer', 'created_at', 'created_by', 'published']
+        exclude=['question', 'answer', 'created_at', 'created_by',
+                 'published']
     )
-
-    def get_template_names(self):
-
-        if self.question.template_type:
-            type_suffix = self.question.template_type.template_suffix
-        else:
-            type_suffix = 'default'
-
-        self.template_suffix = "{0}_{1}".format(type_suffix,
-                                                self.template_suffix)
-
-        module_name = self.question.module_name
-        model_name = self.question.model_name
-
-        common_data = dict(
-            object_name=self.object_name,
-            module_name=module_name,
-            model_name=model_name,
-            suffix=self.template_suffix,
-            ext=self.template_ext
-        )
-
-        names = [
-            u"{object_name}/{content_slug}.{ext}".format(
-                content_slug=self.question.long_slug, **common_data),
-            u"{object_name}/{content_slug}_{suffix}.{ext}".format(
-                content_slug=self.question.long_slug, **common_data),
-            u"{object_name}/{content_slug}.{ext}".format(
-                content_slug=self.question.slug, **common_data),
-            u"{object_name}/{content_slug}_{suffix}.{ext}".format(
-                content_slug=self.question.slug, **common_data)
-        ]
-
-        channel_list = self.question.channel.get_ancestors_slugs()
-        for channel in channel_list:
-            path = ("{object_name}/_{module_name}/{channel}/"
-                    "{model_name}_{suffix}.{ext}")
-            names.append(path.format(channel=channel, **common_data))
-
-        for channel in channel_list:
-            path = "{object_name}/_{module_name}/{channel}/{suffix}.{ext}"
-            names.append(path.format(channel=channel, **common_data))
-
-        names.append(
-            "{object_name}/_{module_name}/{model_name}_{suffix}.{ext}".format(
-                **common_data
-            )
-        )
-
-        names.append(
-            "{object_name}/_{module_name}/{suffix}.{ext}".format(**common_data)
-        )
-
-        for channel in channel_list:
-            path = "{object_name}/{channel}/{model_name}_{suffix}.{ext}"
-            names.append(path.format(channel=channel, **common_data))
-
-        for channel in channel_list:
-            path = "{object_name}/{channel}/{suffix}.{ext}"
-            names.append(path.format(channel=channel, **common_data))
-
-        names.append(
-            "{object_name}/{model_name}_{suffix}.{ext}".format(**common_data)
-        )
-
-        names.append("{object_name}/{suffix}.{ext}".format(**common_data))
-
-        return names
+    form_classes = LRUCache(maxsize=5000)
 
     def get_context_by_pretty_slug(self, pretty_slug, render_content=False):
 
         now = datetime.now()
-        homepage = Channel.objects.get(is_homepage=True)
+        homepage = Channel.get_homepage()
 
-        if pretty_slug.startswith(homepage.slug) and \
+        if homepage and pretty_slug.startswith(homepage.slug) and \
                 len(pretty_slug.split('/')) < 3 and \
                 not render_content:
             slug = pretty_slug.split('/')[-1]
@@ -182,6 +107,8 @@ class QuestionDetail(MethodView):
                 **filters
             )
         except Question.DoesNotExist:
+            if homepage is None:
+                abort(404)
             question = Content.objects.get_or_404(
                 channel=homepage,
                 slug=pretty_slug,
@@ -194,9 +121,9 @@ class QuestionDetail(MethodView):
     def get_context_by_long_slug(self, long_slug, render_content=False):
 
         now = datetime.now()
-        homepage = Channel.objects.get(is_homepage=True)
+        homepage = Channel.get_homepage()
 
-        if long_slug.startswith(homepage.slug) and \
+        if homepage and long_slug.startswith(homepage.slug) and \
                 len(long_slug.split('/')) < 3 and \
                 not render_content:
             slug = long_slug.split('/')[-1]
@@ -213,6 +140,8 @@ class QuestionDetail(MethodView):
                 **filters
             )
         except Question.DoesNotExist:
+            if homepage is None:
+                abort(404)
             question = Content.objects.get_or_404(
                 channel=homepage,
                 slug=long_slug,
@@ -221,24 +150,36 @@ class QuestionDetail(MethodView):
 
         return self.get_context(question)
 
-    def get_context(self, question):
-
-        labels = [question.choice_A,
-                  question.choice_B,
-                  question.choice_C,
-                  question.choice_D,
-                  question.choice_E]
-        choices = [(chr(65+c), v) for c,v in list(enumerate(labels))]
+    def get_form_class(self, question, seed):
+        """answer form with the choices of question shuffled by seed,
+        built once per question version and seed. Form is subclassed,
+        never changed, so concurrent requests do not share a field"""
+        key = (question.pk, question.updated_at, seed)
+        form_class = self.form_classes.get(key)
+        if form_class is None:
+            labels = [question.choice_A,
+                      question.choice_B,
+                      question.choice_C,
+                      question.choice_D,
+                      question.choice_E]
+            choices = [(chr(65+c), v) for c,v in list(enumerate(labels))]
+
+            r = random.Random()
+            r.seed(seed)
+            r.shuffle(choices)
+
+            form_class = type('AnswerForm', (self.Form,), {
+                'answer': RadioField('Choice', choices=choices)
+            })
+            self.form_classes.set(key, form_class)
+        return form_class
 
-        r = random.Random()
-        r.seed(session['user_id'])
-        r.shuffle(choices)
-
-        self.Form.answer = RadioField('Choice', choices=choices)
+    def get_context(self, question):
 
-        form = self.Form(request.form)
+        form_class = self.get_form_class(question, session['user_id'])
+        form = form_class(request.form)
 
-        self.question = question
+        self.question = self.content = question
 
         context = {
             "question": question,
@@ -253,14 +194,15 @@ class QuestionDetail(MethodView):
         if not render_content and isinstance(context, collections.Callable):
             return context
         return render_template(
-            self.get_template_names(),
+            self.get_template_names,
             theme=self.question.get_themes(),
+            cache_key=self.get_template_cache_key(),
             **context
         )
 
 
-    def post(self, long_slug):
-        context = self.get_context_by_long_slug(long_slug)
+    def post(self, pretty_slug):
+        context = self.get_context_by_pretty_slug(pretty_slug)
         form = context.get('form')
 
         #if form.validate():
@@ -278,22 +220,54 @@ class QuestionDetail(MethodView):
             form.populate_obj(answer)
 
             question = context.get('question')
-            question.tries.append(answer)
-            question.save()
+            question.add_answer(answer, user=get_current_user(reference=True))
 
             #candidate = context.get('candidate')
             #candidate.answers.append(answer)
             #candidate.save()
 
-            return redirect(url_for('.detail', long_slug=long_slug))
+            return redirect(url_for('question-detail',
+                                    pretty_slug=pretty_slug))
 
         return render_template(
-            self.get_template_names(),
+            self.get_template_names,
             theme=self.question.get_themes(),
+            cache_key=self.get_template_cache_key(),
             **context
         )
 
 
+class QuestionStats(MethodView):
+    """answer counters of a question as json"""
+    decorators = [roles_accepted('admin', 'editor')]
+
+    def get(self, pretty_slug):
+        question = Question.objects.only(
+            'title', 'pretty_slug', 'answer_count', 'correct_count',
+            'tallies', 'correct_answer'
+        ).get_or_404(pretty_slug=pretty_slug)
+        stats = question.get_stats()
+        stats.update(title=question.title,
+                     pretty_slug=question.pretty_slug,
+                     correct_answer=question.correct_answer)
+        return jsonify(stats)
+
+
+class ChannelQuestionStats(MethodView):
+    """answer counters of the questions of a channel and its
+    descendants as json"""
+    decorators = [roles_accepted('admin', 'editor')]
+
+    def get(self, long_slug):
+        channel = channel_tree.get_by_long_slug(long_slug)
+        if channel is None:
+            abort(404)
+        stats = channel_stats(
+            channel, descendants=request.args.get('descendants') != '0')
+        stats.update(channel=channel.long_slug)
+        return jsonify(stats)
+
+
 class ContentFeed(MethodView):
     pass
 
@@ -43,6 +43,30 @@ Take a look at Flask-Cache documentation
 """
 CACHE_TYPE = "simple"
 
+"""
+Full page cache for anonymous hits on channel and content pages
+RESPONSE_CACHE_TYPE can be 'simple' (memory of each worker) or
+'filesystem' (shared by workers of the same host in RESPONSE_CACHE_DIR)
+"""
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_TYPE = "simple"
+RESPONSE_CACHE_DIR = "/tmp/quokka_response_cache"
+RESPONSE_CACHE_TIMEOUT = 300
+RESPONSE_CACHE_THRESHOLD = 500
+
+"""
+Invalidations of the in-process caches (channel tree, config, templates and
+'simple' response cache) reach the other workers through a bus
+INVALIDATION_BUS can be None (a single worker), 'mongodb' (a capped
+collection, for workers on any host) or 'file' (workers of the same host)
+see quokka.core.bus for INVALIDATION_BUS_OPTIONS
+a message missing from the sequence is waited for INVALIDATION_BUS_GRACE
+seconds before everything is invalidated
+"""
+INVALIDATION_BUS = None
+INVALIDATION_BUS_OPTIONS = {}
+INVALIDATION_BUS_GRACE = 2
+
 
 """
 Not needed by flask, but those root folders are used
@@ -65,6 +89,33 @@ but will append a random int i.e: blog-post-2342342
 """
 SMART_SLUG_ENABLED = False
 
+"""
+Default number of contents per page in channel listings
+each ChannelType can override it with its own per_page value
+"""
+PAGINATION_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+
+"""
+How channel listings select the contents of a channel and its descendants
+'regex' uses an anchored prefix regex on the mpath index
+'ancestors' uses an equality match on the multikey ancestor_mpaths index
+run `python manage.py backfill_ancestor_mpaths` before using 'ancestors'
+"""
+MPATH_QUERY_STRATEGY = 'regex'
+
+"""
+Renaming or moving a channel rewrites long_slug and mpath of its
+descendant channels and contents after the channel is saved.
+ASYNC_SAVE_MODE = True hands it to the celery worker of
+quokka.core.tasks (CELERY_BROKER_URL must be set), otherwise it runs in
+the request when at most CHANNEL_MOVE_INLINE_LIMIT contents move and in
+a background thread when more do. Interrupted moves are resumed by
+`python manage.py run_channel_moves`
+"""
+ASYNC_SAVE_MODE = False
+CHANNEL_MOVE_INLINE_LIMIT = 1000
+
 """
 Blueprints are quokka-modules, you don't need to install
 just develop or download and drop in your modules folder
@@ -80,6 +131,21 @@ Default configuration for FLask-Admin instance
 """
 ADMIN = {'name': 'Quokka admin', 'url': '/admin'}
 
+"""
+How admin list views search their column_searchable_list
+'text' uses a text index per collection, created at startup
+'regex' uses a case insensitive regex per column, a collection scan
+views whose columns are not covered by a text index use 'regex'
+"""
+ADMIN_SEARCH_BACKEND = 'text'
+
+"""
+Create at startup the indexes missing for admin column_filters and
+column_default_sort, when False a warning is logged for each of them.
+boolean filters and filters on fields with choices are never indexed
+"""
+ADMIN_AUTO_INDEXES = True
+
 """
 File admin can expose folders, you just need to have them
 mapped in your server or in flask, see quooka.ext.views
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from mongoengine import (Document, StringField, BooleanField,
+                         DateTimeField)
+from quokka.core.admin.indexes import db_fields
+
+
+class Indexed(Document):
+    author = StringField(db_field='a')
+    status = StringField(choices=('draft', 'live'))
+    published = BooleanField()
+    created_at = DateTimeField()
+
+
+class TestAdminIndexes(unittest.TestCase):
+    def test_low_cardinality_filters_are_not_indexed(self):
+        columns = ('author', 'status', 'published', 'created_at', 'nope')
+        self.assertEquals(db_fields(Indexed, columns),
+                          ['a', 'status', 'published', 'created_at'])
+        self.assertEquals(db_fields(Indexed, columns, True),
+                          ['a', 'created_at'])
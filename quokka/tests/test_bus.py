@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from quokka.core.bus import FileTransport, InvalidationBus
+
+
+class TestInvalidationBus(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.transport = FileTransport(os.path.join(self.folder, 'bus'),
+                                       max_bytes=200)
+        self.bus = InvalidationBus()
+        self.events = []
+        self.bus.dispatch = lambda event, payload, remote=False: \
+            self.events.append(event)
+        self.bus.on_all = lambda payload, remote=False: \
+            self.events.append('all')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def message(self, event, origin='other'):
+        message = {'origin': origin, 'event': event, 'payload': {}}
+        self.transport.send(message)
+        return message
+
+    def test_file_transport_keeps_counting_after_rotation(self):
+        self.assertEquals(self.transport.last_seq(), 0)
+        for i in range(20):
+            self.message('channels')
+        self.assertEquals(self.transport.last_seq(), 20)
+        self.assertTrue(os.path.getsize(self.transport.path) < 400)
+
+    def test_file_transport_survives_long_lines(self):
+        message = {'origin': 'other', 'event': 'purge',
+                   'payload': {'tags': ['x' * 5000]}}
+        self.transport.send(message)
+        self.message('channels')
+        self.assertEquals(self.transport.last_seq(), 2)
+
+    def test_reset_counter_resyncs(self):
+        self.bus.receive(self.message('channels'))
+        self.bus.receive(self.message('channels'))
+        os.remove(self.transport.counter_path)
+        os.remove(self.transport.path)
+        self.bus.receive(self.message('templates'))
+        self.bus.receive(self.message('purge'))
+        self.assertEquals(self.events,
+                          ['channels', 'channels', 'all', 'purge'])
+        self.assertEquals(self.bus.version, 2)
+
+    def test_receive(self):
+        self.bus.receive(self.message('channels'))
+        self.bus.receive(self.message('config', origin=self.bus.origin))
+        self.assertEquals(self.events, ['channels'])
+        self.assertEquals(self.bus.version, 2)
+
+    def test_messages_inserted_late_run_in_order(self):
+        self.bus.receive(self.message('channels'))
+        late = self.message('templates')
+        self.bus.receive(self.message('purge'))
+        self.assertEquals(self.events, ['channels'])
+        self.assertEquals(self.bus.receive(late), 3)
+        self.assertEquals(self.events, ['channels', 'templates', 'purge'])
+        self.assertEquals(self.bus.stats['missed'], 0)
+
+    def test_missed_messages_invalidate_everything(self):
+        self.bus.grace = 0
+        self.bus.receive(self.message('channels'))
+        self.message('templates')
+        self.bus.receive(self.message('purge'))
+        self.assertEquals(self.events, ['channels', 'all'])
+        self.assertEquals(self.bus.stats['missed'], 1)
+        self.assertEquals(self.bus.version, 3)
+        self.bus.receive({'seq': 2, 'origin': 'other', 'event': 'templates',
+                          'payload': {}})
+        self.assertEquals(self.events, ['channels', 'all'])
+        self.assertEquals(self.bus.version, 3)
+
+
+class BrokenTransport(object):
+    def __init__(self, stopped):
+        self.stopped = stopped
+
+    def last_seq(self):
+        self.stopped.set()
+        raise IOError('unreachable')
+
+
+class TestListener(unittest.TestCase):
+    def setUp(self):
+        self.bus = InvalidationBus()
+
+        def on_all(payload, remote=False):
+            raise IOError('unreachable')
+        self.bus.on_all = on_all
+
+    def test_failed_resyncs_do_not_raise(self):
+        self.bus.grace = 0
+        self.bus._pending[3] = {}
+        self.bus._gap_since = 0
+        self.bus.check_gap()
+        self.assertEquals(self.bus.version, 3)
+
+    def test_listener_can_be_restarted_after_it_exits(self):
+        self.bus.transport = BrokenTransport(self.bus._stopped)
+        self.bus._pid = os.getpid()
+        self.bus._thread = threading.current_thread()
+        self.bus.listen()
+        self.assertEquals(self.bus._pid, None)
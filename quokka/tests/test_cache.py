@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from werkzeug.wrappers import Response
+from werkzeug.contrib.cache import SimpleCache
+from quokka.core.cache import ResponseCache, ALL, channel_tag, content_tag
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.cache.backend = SimpleCache()
+        self.cache.set('home', Response('home'), [channel_tag('home')])
+        self.cache.set('post', Response('post'),
+                       [channel_tag('home'), content_tag(1)])
+
+    def test_purging_a_tag_invalidates_its_pages_only(self):
+        self.cache.purge(content_tag(1))
+        self.assertEquals(self.cache.get('post'), None)
+        self.assertEquals(self.cache.get('home')['body'], 'home')
+
+        self.cache.purge(channel_tag('home'))
+        self.assertEquals(self.cache.get('home'), None)
+        self.assertEquals(self.cache.stats()['hits'], 1)
+        self.assertEquals(self.cache.stats()['misses'], 2)
+
+    def test_purging_all(self):
+        self.cache.purge(ALL)
+        self.assertEquals(self.cache.get('home'), None)
+        self.assertEquals(self.cache.get('post'), None)
+
+    def test_csrf_tokens_are_not_cached(self):
+        body = '<input name="csrf_token" type="hidden" value="secret">'
+        self.cache.set('form', Response(body), [])
+        self.assertFalse('secret' in self.cache.get('form')['body'])
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import datetime
+import unittest
+from flask.ext.testing import TestCase
+from quokka import create_app
+from quokka.core.admin import create_admin
+from quokka.core.db import db
+from quokka.core.models import (Channel, ChannelType, Content, ChannelMove,
+                                Link)
+
+
+class TestChannelMove(TestCase):
+
+    def create_app(self):
+        self.admin = create_admin()
+        return create_app(config='quokka.test_settings',
+                          DEBUG=False,
+                          test=True,
+                          admin_instance=self.admin)
+
+    def setUp(self):
+        self.channels = []
+        self.root = self.channel('test-root')
+        self.other = self.channel('test-other')
+        self.moved = self.channel('test-moved', parent=self.root)
+        self.child = self.channel('test-child', parent=self.moved)
+        self.link = Link(title='test-link', slug='test-link',
+                         channel=self.child, link='http://example.com')
+        self.link.save()
+
+    def tearDown(self):
+        ChannelMove.objects.delete()
+        Content.objects(channel__in=self.channels).delete()
+        for channel in reversed(self.channels):
+            channel.delete()
+        ChannelType.objects(identifier='test-themed').delete()
+
+    def channel(self, slug, parent=None):
+        channel = Channel(title=slug, slug=slug, parent=parent)
+        channel.save()
+        self.channels.append(channel)
+        return channel
+
+    def long_slugs(self):
+        return (Channel.objects.get(pk=self.child.pk).long_slug,
+                Content.objects.get(pk=self.link.pk).long_slug)
+
+    def hold(self, old_mpath, new_mpath, status='running'):
+        """a move run by another process"""
+        return ChannelMove(
+            old_mpath=old_mpath, new_mpath=new_mpath, status=status,
+            locked_until=datetime.datetime.now() + datetime.timedelta(
+                seconds=60)).save()
+
+    def test_rename(self):
+        self.moved.slug = 'test-renamed'
+        self.moved.save()
+        self.assertEquals(self.long_slugs(), (
+            'test-root/test-renamed/test-child',
+            'test-root/test-renamed/test-child/test-link'))
+        self.assertEquals(ChannelMove.objects.get().status, 'done')
+
+    def test_move(self):
+        self.moved.parent = self.other
+        self.moved.save()
+        self.assertEquals(self.long_slugs(), (
+            'test-other/test-moved/test-child',
+            'test-other/test-moved/test-child/test-link'))
+        self.assertEquals(Channel.objects.get(pk=self.child.pk).mpath,
+                          ',test-other,test-moved,test-child,')
+
+    def test_theme_chains_are_rebuilt_by_the_move(self):
+        themed = ChannelType(title='Test themed', identifier='test-themed',
+                             template_suffix='test', theme_name='green')
+        themed.save()
+        self.other.channel_type = themed
+        self.other.save()
+
+        link = Link(title='test-moved-link', slug='test-moved-link',
+                    channel=self.moved, link='http://example.com')
+        link.save()
+
+        held = self.hold(',test-root,', ',test-root2,')
+        self.moved.parent = self.other
+        self.moved.save()
+        self.assertEquals(Content.objects.get(pk=link.pk).theme_chain, [])
+
+        held.update(set__status='done')
+        ChannelMove.run_pending()
+        for pk in (link.pk, self.link.pk):
+            self.assertEquals(Content.objects.get(pk=pk).theme_chain,
+                              ['green'])
+        self.assertEquals(Channel.objects.get(pk=self.child.pk).theme_chain,
+                          ['green'])
+
+    def test_failed_save_leaves_no_move(self):
+        self.moved.slug = 'test-renamed'
+        self.moved.title = None
+        self.assertRaises(db.ValidationError, self.moved.save)
+        self.assertEquals(ChannelMove.objects.count(), 0)
+
+        self.moved.reload()
+        self.moved.slug = 'test-renamed'
+        self.moved.save()
+        self.assertEquals(self.long_slugs()[0],
+                          'test-root/test-renamed/test-child')
+
+    def test_moves_held_elsewhere(self):
+        # another part of the tree does not block the move
+        self.hold(',test-other,', ',test-other2,')
+        self.moved.slug = 'test-renamed'
+        self.moved.save()
+        self.assertEquals(self.long_slugs()[0],
+                          'test-root/test-renamed/test-child')
+
+        # the same part waits until the lease of the older move ends
+        held = self.hold(',test-root,', ',test-root2,')
+        self.moved.slug = 'test-again'
+        self.moved.save()
+        self.assertEquals(self.long_slugs()[0],
+                          'test-root/test-renamed/test-child')
+        held.update(set__status='done')
+        ChannelMove.run_pending()
+        self.assertEquals(self.long_slugs()[0],
+                          'test-root/test-again/test-child')
+
+    def test_failed_moves_wait_for_a_retry(self):
+        self.hold(',test-other,', ',test-other2,', status='failed')
+        failed = self.hold(',test-root,test-moved,', ',test-root,test-x,',
+                           status='failed')
+        self.moved.slug = 'test-renamed'
+        self.moved.save()
+        self.assertEquals(self.long_slugs()[0],
+                          'test-root/test-moved/test-child')
+
+        failed.delete()
+        ChannelMove.run_pending()
+        self.assertEquals(self.long_slugs()[0],
+                          'test-root/test-renamed/test-child')
+        ChannelMove.retry_failed()
+        self.assertEquals(ChannelMove.objects(status='failed').count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
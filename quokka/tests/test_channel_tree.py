@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from datetime import datetime
+from bson import ObjectId, DBRef
+from quokka.core.tree import ChannelTreeSnapshot
+
+
+class FakeChannel(object):
+    def __init__(self, long_slug, parent=None, channel_type=None,
+                 is_homepage=False, show_in_menu=True, updated_at=None):
+        self.pk = ObjectId()
+        self.updated_at = updated_at or datetime(2014, 1, 1)
+        self.long_slug = long_slug
+        self.mpath = ",{0},".format(long_slug.replace('/', ','))
+        self.is_homepage = is_homepage
+        self.show_in_menu = show_in_menu
+        self._data = {
+            'parent': parent and DBRef('channel', parent.pk),
+            'channel_type': channel_type and DBRef('channel_type',
+                                                   channel_type.pk)
+        }
+
+    def to_mongo(self):
+        return {'_id': self.pk, 'long_slug': self.long_slug,
+                'updated_at': self.updated_at}
+
+    @property
+    def parent(self):
+        return self._data['parent']
+
+    @property
+    def channel_type(self):
+        return self._data['channel_type']
+
+
+class FakeChannelType(object):
+    def __init__(self, theme_name):
+        self.pk = ObjectId()
+        self.theme_name = theme_name
+
+    def to_mongo(self):
+        return {'_id': self.pk, 'theme_name': self.theme_name}
+
+
+class TestChannelTreeSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.blog_type = FakeChannelType('cosmo')
+        self.home = FakeChannel('home', is_homepage=True)
+        self.articles = FakeChannel('articles', channel_type=self.blog_type)
+        self.tech = FakeChannel('articles/tech', parent=self.articles,
+                                updated_at=datetime(2014, 2, 1))
+        self.python = FakeChannel('articles/tech/python', parent=self.tech,
+                                  show_in_menu=False)
+        self.snapshot = ChannelTreeSnapshot(
+            [self.home, self.articles, self.tech, self.python],
+            [self.blog_type],
+            version=1
+        )
+
+    def test_references_are_resolved_from_snapshot(self):
+        self.assertTrue(self.python.parent is self.tech)
+        self.assertTrue(self.articles.channel_type is self.blog_type)
+        self.assertEquals(self.home.channel_type, None)
+
+    def test_children(self):
+        self.assertEquals(self.snapshot.children[None],
+                          [self.articles, self.home])
+        self.assertEquals(self.snapshot.children[self.articles.pk],
+                          [self.tech])
+
+    def test_ancestors_include_self_as_first_item(self):
+        self.assertEquals(self.snapshot.ancestors[self.python.pk],
+                          [self.python, self.tech, self.articles])
+
+    def test_descendants_include_self_as_first_item(self):
+        self.assertEquals(self.snapshot.descendants[self.articles.pk],
+                          [self.articles, self.tech, self.python])
+
+    def test_homepage(self):
+        self.assertTrue(self.snapshot.homepage is self.home)
+
+    def test_etag_follows_the_loaded_documents(self):
+        channels = [self.home, self.articles, self.tech, self.python]
+        same = ChannelTreeSnapshot(channels, [self.blog_type], version=2)
+        self.assertEquals(same.etag, self.snapshot.etag)
+
+        deleted = ChannelTreeSnapshot(channels[:-1], [self.blog_type], 1)
+        self.assertNotEquals(deleted.etag, self.snapshot.etag)
+
+        self.blog_type.theme_name = 'pure'
+        changed = ChannelTreeSnapshot(channels, [self.blog_type], 1)
+        self.assertNotEquals(changed.etag, self.snapshot.etag)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from quokka.core.config import ConfigSnapshot, ConfigRegistry
+
+
+class FakeValue(object):
+    def __init__(self, name, value):
+        self.name = name
+        self._value = value
+
+    @property
+    def value(self):
+        if isinstance(self._value, Exception):
+            raise self._value
+        return self._value
+
+
+class FakeConfig(object):
+    def __init__(self, group, **values):
+        self.group = group
+        self.values = [FakeValue(name, value)
+                       for name, value in sorted(values.items())]
+
+
+class FakeRegistry(ConfigRegistry):
+    def __init__(self, configs):
+        super(FakeRegistry, self).__init__()
+        self.configs = configs
+
+    def build(self):
+        self.loads += 1
+        return ConfigSnapshot(self.configs, self.version)
+
+
+class TestConfigRegistry(unittest.TestCase):
+    def setUp(self):
+        self.settings = FakeConfig('settings', SITE=u'Quokka', PER_PAGE=10,
+                                   BROKEN=ValueError('bad json'))
+        self.registry = FakeRegistry([self.settings, FakeConfig('other')])
+
+    def test_get(self):
+        self.assertEquals(self.registry.get('settings', 'PER_PAGE'), 10)
+        self.assertEquals(self.registry.get('settings', 'NOPE', 5), 5)
+        self.assertEquals(self.registry.get('nope', 'SITE', 'x'), 'x')
+        self.assertEquals(self.registry.get('settings', 'BROKEN', 1), 1)
+        self.assertIs(self.registry.get('settings'), self.settings.values)
+        self.assertEquals(self.registry.get_group('settings'),
+                          {'SITE': u'Quokka', 'PER_PAGE': 10})
+
+    def test_loads_once_until_invalidated(self):
+        for i in range(3):
+            self.registry.get('settings', 'SITE')
+        self.registry.get('settings', 'NOPE')
+        self.assertEquals(self.registry.stats['loads'], 1)
+        self.assertEquals(self.registry.stats['hits'], 3)
+        self.assertEquals(self.registry.stats['misses'], 1)
+
+        self.settings.values.append(FakeValue('NEW', True))
+        self.assertEquals(self.registry.get('settings', 'NEW'), None)
+        self.registry.invalidate()
+        self.assertEquals(self.registry.get('settings', 'NEW'), True)
+        self.assertEquals(self.registry.stats['loads'], 2)
+
+    def test_etag_follows_the_values(self):
+        etag = self.registry.etag
+        self.assertEquals(FakeRegistry(self.registry.configs).etag, etag)
+        self.settings.values.append(FakeValue('NEW', True))
+        self.registry.invalidate()
+        self.assertNotEquals(self.registry.etag, etag)
+
+    def test_duplicated_names_are_ignored(self):
+        config = FakeConfig('dup', A=1)
+        config.values.append(FakeValue('A', 2))
+        registry = FakeRegistry([config])
+        self.assertEquals(registry.get('dup', 'A', 'default'), 'default')
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import datetime
+import unittest
+from flask.ext.testing import TestCase
+from mongoengine import signals
+from quokka import create_app
+from quokka.core.admin import create_admin
+from quokka.core.models import (Channel, ChannelType, Comment, CommentAdmin,
+                                Content, Link)
+
+
+class ContentTestCase(TestCase):
+
+    def create_app(self):
+        self.admin = create_admin()
+        return create_app(config='quokka.test_settings',
+                          DEBUG=False,
+                          test=True,
+                          admin_instance=self.admin)
+
+    def setUp(self):
+        self.channel_type = ChannelType(title='Test type',
+                                        identifier='test-type',
+                                        template_suffix='test',
+                                        theme_name='blue')
+        self.channel_type.save()
+        self.parent = Channel(title='Test parent', slug='test-parent',
+                              channel_type=self.channel_type)
+        self.parent.save()
+        self.channel = Channel(title='Test child', slug='test-child',
+                               parent=self.parent)
+        self.channel.save()
+
+    def tearDown(self):
+        contents = Content.objects(channel__in=[self.parent, self.channel])
+        Comment.objects(content__in=contents).delete()
+        contents.delete()
+        self.channel.delete()
+        self.parent.delete()
+        self.channel_type.delete()
+
+    def link(self, slug, **kwargs):
+        return Link(title=slug, slug=slug, channel=self.channel,
+                    link='http://example.com', **kwargs)
+
+
+class TestBulkSave(ContentTestCase):
+
+    def test_inserts_and_updates(self):
+        existing = self.link('test-existing')
+        existing.save()
+        existing.title = 'changed'
+        new = self.link('test-new')
+
+        self.assertEquals(Link.bulk_save([existing, new]), [])
+        self.assertFalse(new._created)
+        self.assertEquals(Link.objects.get(pk=existing.pk).title, 'changed')
+        self.assertEquals(Link.objects.get(pk=new.pk).long_slug,
+                          'test-parent/test-child/test-new')
+
+    def test_duplicated_slugs_are_errors(self):
+        self.link('test-taken').save()
+        taken, twin, first = (self.link('test-taken'), self.link('test-twin'),
+                              self.link('test-twin'))
+        errors = Link.bulk_save([taken, first, twin])
+
+        self.assertEquals([document for document, error in errors],
+                          [taken, twin])
+        self.assertTrue(first.pk)
+        self.assertEquals(twin.pk, None)
+        self.assertEquals(
+            Link.objects(channel=self.channel, slug='test-twin').count(), 1)
+
+    def test_smart_slug_renames_duplicates(self):
+        self.app.config['SMART_SLUG_ENABLED'] = True
+        self.link('test-taken').save()
+        taken = self.link('test-taken')
+        self.assertEquals(Link.bulk_save([taken]), [])
+        self.assertTrue(taken.slug.startswith('test-taken-'))
+
+
+class TestThemeChain(ContentTestCase):
+
+    def test_chain_follows_the_parent_theme(self):
+        link = self.link('test-themed')
+        link.save()
+        self.assertEquals(Channel.objects.get(pk=self.channel.pk).theme_chain,
+                          ['blue'])
+        self.assertEquals(Link.objects.get(pk=link.pk).theme_chain, ['blue'])
+
+        self.channel_type.theme_name = 'green'
+        self.channel_type.save()
+        self.assertEquals(Channel.objects.get(pk=self.channel.pk).theme_chain,
+                          ['green'])
+        self.assertEquals(Link.objects.get(pk=link.pk).theme_chain,
+                          ['green'])
+
+
+class TestCustomValues(ContentTestCase):
+
+    def test_writes_touch_the_content(self):
+        link = self.link('test-values')
+        link.save()
+        saved = []
+
+        def receiver(sender, document, **kwargs):
+            saved.append(document)
+        signals.post_save.connect(receiver, sender=Link)
+
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+        Link.objects(pk=link.pk).update_one(set__updated_at=yesterday)
+        try:
+            link.values.create(name='color', rawvalue='red')
+            link.values.update({'rawvalue': 'blue'}, name='color')
+        finally:
+            signals.post_save.disconnect(receiver, sender=Link)
+
+        stored = Link.objects.get(pk=link.pk)
+        self.assertEquals(stored.values.get(name='color').value, 'blue')
+        self.assertTrue(stored.updated_at > yesterday)
+        self.assertEquals(saved, [link, link])
+
+
+class TestCommentCount(ContentTestCase):
+
+    def count(self):
+        return Link.objects.get(pk=self.content.pk).comment_count
+
+    def test_published_comments_are_counted(self):
+        self.content = self.link('test-commented')
+        self.content.save()
+        comments = [Comment(content=self.content, author='a', body='b')
+                    for i in range(3)]
+        for comment in comments:
+            comment.save()
+        Comment(content=self.content, author='a', body='b',
+                published=False).save()
+        self.assertEquals(self.count(), 3)
+
+        comment = Comment.objects.get(pk=comments[0].pk)
+        comment.published = False
+        comment.save()
+        comment.body = 'edited'
+        comment.save()
+        self.assertEquals(self.count(), 2)
+        comments[1].delete()
+        self.assertEquals(self.count(), 1)
+
+        admin = CommentAdmin(Comment)
+        admin.update_published(Comment.objects(content=self.content), True)
+        self.assertEquals(self.count(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import csv
+import json
+import gzip
+import unittest
+from cStringIO import StringIO
+from quokka.core.exporter import csv_rows, json_array, json_lines, gzipped
+
+CHUNKS = [[{'_id': 1, 'title': u'caf\xe9, "bar"'}, {'_id': 2, 'x': [1]}],
+          [{'_id': 3}]]
+
+
+class TestExporter(unittest.TestCase):
+    def test_csv_rows_have_the_same_columns(self):
+        output = "".join(csv_rows(iter(CHUNKS), ['_id', 'title', '_extra']))
+        rows = list(csv.reader(StringIO(output)))
+        self.assertEquals(rows[0], ['_id', 'title', '_extra'])
+        self.assertEquals(rows[1][1].decode('utf-8'), u'caf\xe9, "bar"')
+        self.assertEquals(json.loads(rows[2][2]), {'x': [1]})
+        self.assertEquals(set(len(row) for row in rows), set([3]))
+
+    def test_json_array_and_lines(self):
+        self.assertEquals(len(json.loads("".join(json_array(iter(CHUNKS))))),
+                          3)
+        self.assertEquals(json.loads("".join(json_array(iter([])))), [])
+        lines = "".join(json_lines(iter(CHUNKS))).splitlines()
+        self.assertEquals([json.loads(line)['_id'] for line in lines],
+                          [1, 2, 3])
+
+    def test_gzipped(self):
+        data = "".join(gzipped(iter(['a' * 1000, 'b' * 1000])))
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO(data)).read(),
+                          'a' * 1000 + 'b' * 1000)
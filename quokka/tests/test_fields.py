@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from mongoengine import EmbeddedDocument, StringField, IntField
+from quokka.core.fields import (FilteredList, IndexedItem,
+                                MultipleObjectsReturned)
+
+
+class Item(IndexedItem, EmbeddedDocument):
+    name = StringField()
+    kind = IntField()
+
+
+class PlainItem(object):
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+
+
+class TestFilteredList(unittest.TestCase):
+    def setUp(self):
+        self.items = FilteredList([Item(name='a', kind=1),
+                                   Item(name='b', kind=1),
+                                   Item(name='c', kind=2)],
+                                  None, 'items')
+
+    def test_lookups(self):
+        self.assertEquals(self.items.get(name='b').name, 'b')
+        self.assertEquals(self.items.get(name='z'), [])
+        self.assertRaises(MultipleObjectsReturned, self.items.get, kind=1)
+        self.assertEquals([i.name for i in self.items.filter(kind=1)],
+                          ['a', 'b'])
+        self.assertEquals([i.name for i in self.items.exclude(kind=1)],
+                          ['c'])
+        self.assertEquals(self.items.filter(kind=1, name='a').count(), 1)
+        self.assertEquals(self.items.filter(kind=[1]).count(), 0)
+
+    def test_indexes_follow_the_list(self):
+        self.items.get(name='a')
+        self.assertIn(('name',), self.items._indexes)
+        self.items.append(Item(name='d', kind=3))
+        self.assertEquals(self.items._indexes, {})
+        self.assertEquals(self.items.get(name='d').kind, 3)
+
+    def test_indexes_follow_items_changed_in_place(self):
+        self.items.get(name='a').name = 'b'
+        self.assertEquals(self.items.get(name='a'), [])
+        self.assertEquals(self.items.filter(name='b').count(), 2)
+        self.items.filter(name='c')[0].kind = 1
+        self.assertEquals(self.items.filter(kind=1).count(), 3)
+
+    def test_other_items_are_scanned(self):
+        items = FilteredList([PlainItem('a', 1), PlainItem('b', 2)],
+                             None, 'items')
+        items.get(name='a').name = 'c'
+        self.assertEquals(items.get(name='c').kind, 1)
+        self.assertEquals(items._indexes, {})
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import json
+import unittest
+from StringIO import StringIO
+from quokka.modules.question.importer import (read_json, read_json_array,
+                                              RowError)
+
+
+class ChunkedStream(StringIO):
+    """counts how much of the stream was read"""
+
+    def __init__(self, value):
+        StringIO.__init__(self, value)
+        self.reads = []
+
+    def read(self, size=-1):
+        data = StringIO.read(self, size)
+        self.reads.append(len(data))
+        return data
+
+
+class TestReadJson(unittest.TestCase):
+    def rows(self, value):
+        return [row if not isinstance(row, RowError) else 'error'
+                for row in read_json(StringIO(value))]
+
+    def test_array(self):
+        self.assertEquals(self.rows(' [{"a": 1}, {"a": 2} ,\n{"a": 3}]'),
+                          [{'a': 1}, {'a': 2}, {'a': 3}])
+        self.assertEquals(self.rows('[]'), [])
+
+    def test_lines(self):
+        self.assertEquals(self.rows('{"a": 1}\n\n{"a": 2}\n'),
+                          [{'a': 1}, {'a': 2}])
+
+    def test_malformed_rows_are_errors(self):
+        self.assertEquals(self.rows('{"a": 1}\n{"a": \n[1]\n{"a": 3}'),
+                          [{'a': 1}, 'error', 'error', {'a': 3}])
+        self.assertEquals(self.rows('[{"a": 1}, {"a": }, {"a": 3}]'),
+                          [{'a': 1}, 'error'])
+        self.assertEquals(self.rows('[{"a": 1}'), [{'a': 1}, 'error'])
+
+    def test_array_is_read_in_chunks(self):
+        rows = [{'title': u'question {0}'.format(i)} for i in range(100)]
+        stream = ChunkedStream(json.dumps(rows)[1:])
+        reader = read_json_array(stream, chunk_size=64)
+        self.assertEquals(next(reader), rows[0])
+        self.assertTrue(sum(stream.reads) < 128)
+        self.assertEquals(list(reader), rows[1:])
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from quokka.utils.lru import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_key_is_dropped(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEquals(len(cache), 2)
+
+    def test_missing_key_returns_default(self):
+        self.assertEquals(LRUCache().get('missing', 'default'), 'default')
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from datetime import datetime
+from bson import ObjectId
+from quokka.core.pagination import (encode_cursor, decode_cursor,
+                                    InvalidCursor, CursorPage, NEXT, PREV)
+
+
+class Item(object):
+    def __init__(self, created_at):
+        self.created_at = created_at
+        self.pk = ObjectId()
+
+
+class TestCursor(unittest.TestCase):
+    def test_cursor_roundtrip(self):
+        created_at = datetime(2014, 1, 2, 3, 4, 5, 6000)
+        pk = ObjectId()
+        token = encode_cursor(NEXT, created_at, pk)
+        self.assertEquals(decode_cursor(token), (NEXT, created_at, pk))
+
+    def test_cursor_is_url_safe(self):
+        token = encode_cursor(PREV, datetime.now(), ObjectId())
+        self.assertFalse(set(token) & set('+/='))
+
+    def test_forged_cursor_should_raise(self):
+        self.assertRaises(InvalidCursor, decode_cursor, 'not-a-cursor')
+        self.assertRaises(InvalidCursor, decode_cursor,
+                          encode_cursor('x', datetime.now(), ObjectId()))
+
+
+class TestCursorPage(unittest.TestCase):
+    def test_first_page_has_no_prev_cursor(self):
+        page = CursorPage([Item(datetime.now())], has_next=True)
+        self.assertEquals(page.prev_cursor, None)
+        self.assertEquals(decode_cursor(page.next_cursor)[0], NEXT)
+
+    def test_cursors_point_to_page_edges(self):
+        items = [Item(datetime(2014, 1, 2)), Item(datetime(2014, 1, 1))]
+        page = CursorPage(items, has_next=True, has_prev=True)
+        self.assertEquals(decode_cursor(page.prev_cursor)[2], items[0].pk)
+        self.assertEquals(decode_cursor(page.next_cursor)[2], items[1].pk)
+
+    def test_empty_page_is_falsy(self):
+        self.assertFalse(CursorPage([]))
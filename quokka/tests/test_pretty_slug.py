@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from quokka.modules.question import models
+from quokka.modules.question.models import (base36, next_pretty_slug,
+                                            reserve_pretty_slugs)
+
+
+class FakeCounters(object):
+    def __init__(self):
+        self.counters = {}
+
+    def find_and_modify(self, query, update, upsert=False, new=False):
+        counter = self.counters.setdefault(query['_id'], {'next': 0})
+        counter['next'] += update['$inc']['next']
+        return dict(counter)
+
+
+class TestPrettySlug(unittest.TestCase):
+    def setUp(self):
+        self.db = {'counters': FakeCounters()}
+        models.Content._get_db = classmethod(lambda cls: self.db)
+
+    def tearDown(self):
+        del models.Content._get_db  # inherited from Document
+
+    def test_base36(self):
+        self.assertEquals(base36(0), '0')
+        self.assertEquals(base36(35), 'z')
+        self.assertEquals(base36(36), '10')
+        self.assertEquals(base36(36 * 36 + 1), '101')
+
+    def test_slugs_follow_the_counter(self):
+        self.assertEquals(next_pretty_slug(), 'q-1')
+        self.assertEquals(reserve_pretty_slugs(0), [])
+        self.assertEquals(reserve_pretty_slugs(3), ['q-2', 'q-3', 'q-4'])
+        self.db['counters'].counters['question.pretty_slug']['next'] = 34
+        self.assertEquals(reserve_pretty_slugs(2), ['q-z', 'q-10'])
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import logging
+from itertools import islice
 from speaklater import make_lazy_string
 from quokka.modules.accounts.models import User
 
@@ -13,10 +14,57 @@ def lazy_str_setting(key, default=None):
     )
 
 
-def get_current_user():
+def batches(iterable, size):
+    """lists of up to size items of iterable"""
+    iterable = iter(iterable)
+    while True:
+        batch = list(islice(iterable, size))
+        if not batch:
+            return
+        yield batch
+
+
+def dedupe(items):
+    """items in order without repetitions nor empty ones"""
+    seen = set()
+    result = []
+    for item in items:
+        if item and item not in seen:
+            seen.add(item)
+            result.append(item)
+    return result
+
+
+def get_current_user(reference=False):
+    """the logged in User or None, resolved once per request and kept
+    on flask.g.
+
+    with reference=True the user already loaded by flask-login for the
+    request is returned as is, enough for created_by / last_updated_by.
+    the session alone is never trusted, a user which was not loaded yet
+    is loaded (and checked) by flask-login as without reference
+    """
+    from flask import g, has_request_context, _request_ctx_stack
     from flask.ext.security import current_user
+    if not has_request_context():
+        return None
+
+    user = getattr(g, 'current_user_document', None)
+    if user is not None:
+        return user
+
+    loaded = getattr(_request_ctx_stack.top, 'user', None)
+    if reference and isinstance(loaded, User) and \
+            loaded.is_authenticated():
+        return loaded
+
     try:
-        return User.objects.get(id=current_user.id)
+        user = current_user._get_current_object()
+        if not isinstance(user, User):
+            # anonymous or a user of another datastore
+            user = User.objects.get(id=user.id)
     except Exception as e:
         logger.warning("No user found: %s" % e.message)
         return None
+    g.current_user_document = user
+    return user
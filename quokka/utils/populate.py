@@ -392,18 +392,6 @@ class Populate(object):
         for purpose in self.purpose_data:
             self.create_purpose(purpose)
 
-    def create_post(self, data):
-        data['created_by'] = data['last_updated_by'] = self.users.get('editor')
-        data['published'] = True
-        try:
-            post = Post.objects.get(slug=data.get('slug'))
-            logger.info("Post get: {0}".format(post.title))
-        except Exception:
-            post = Post.objects.create(**data)
-            logger.info("Post created: {0}".format(post.title))
-
-        return post
-
     def create_posts(self):
         self.post_data = [
             {
@@ -556,9 +544,14 @@ src="http://cdn-static.zdnet.com/i/r/story/70/00/020234/kitkat-twitter-
 
         ]
 
-        for data in self.post_data:
-            try:
-                self.create_post(data)
-            except:
-                self.create_channels()
-                self.create_post(data)
+        existing = set(Post.objects(
+            slug__in=[data['slug'] for data in self.post_data]
+        ).scalar('slug'))
+        editor = self.users.get('editor')
+        posts = [Post(published=True, **data) for data in self.post_data
+                 if data['slug'] not in existing]
+        errors = Post.bulk_save(posts, user=editor)
+        for post, error in errors:
+            logger.error("Post not created: {0} {1}".format(
+                post.title, error))
+        logger.info("Posts created: {0}".format(len(posts) - len(errors)))